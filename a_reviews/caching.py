@@ -0,0 +1,148 @@
+"""Shared cache helpers for catalogue-wide results.
+
+Anything derived from the whole catalogue (filtered result lists, facet counts,
+autocomplete, the list views' ETags) is cached under the current catalogue
+generation. Review writes and course writes bump the generation, which retires
+every such entry at once without having to know which keys exist.
+
+The generation is a counter row in the database (CatalogueGeneration) rather
+than a cache entry. The cache backend is per process unless CACHES says
+otherwise, and management commands such as import_courses run in their own
+process, so only the database is guaranteed to be seen by every writer and
+reader. Writers bump it once their transaction commits, so the row is never
+locked for longer than its own UPDATE, and until then read a generation of
+their own (see catalogue_generation()). Requests read the row once and reuse
+the value.
+
+Single course rows used by the detail views are cached per course instead, with
+a short timeout, and dropped explicitly whenever that course's row changes.
+Those drops only reach the writer's own process with a per-process cache, so
+elsewhere the timeout bounds how stale a row can get.
+"""
+import hashlib
+import itertools
+import os
+import threading
+from urllib.parse import urlencode
+
+from django.core.cache import cache
+from django.core.signals import request_finished, request_started
+from django.db import transaction
+from django.db.models import F
+
+# Query parameters that pick a page rather than a result set
+PAGINATION_PARAMS = ('cursor', 'page')
+
+# Seconds a cached result list is kept, generation bumps retire it sooner
+RESULT_CACHE_TIMEOUT = 60 * 10
+
+# Rows kept in a cached result list, pages past them are read with keyset queries
+RESULT_CACHE_ROWS = 500
+
+# Seconds a cached course row is kept, writes to the course drop it sooner
+COURSE_CACHE_TIMEOUT = 60
+
+
+# Per thread: the generation read during the current request, and a counter that
+# makes each pending bump's private generation distinct
+_local = threading.local()
+_pending_bumps = itertools.count(1)
+
+
+def _request_started(**kwargs):
+    _local.in_request = True
+    _local.generation = None
+
+
+def _request_finished(**kwargs):
+    _local.in_request = False
+    _local.generation = None
+
+
+request_started.connect(_request_started)
+request_finished.connect(_request_finished)
+
+
+def _committed_generation():
+    generation = getattr(_local, 'generation', None)
+    if generation is None:
+        # Imported here, the models module imports this one
+        from a_reviews.models import CatalogueGeneration
+        generation = CatalogueGeneration.objects.filter(
+            pk=CatalogueGeneration.ROW
+        ).values_list('value', flat=True).first() or 0
+        if getattr(_local, 'in_request', False):
+            _local.generation = generation
+    return generation
+
+
+def _bump_pending():
+    """True while the current transaction has a generation bump waiting to commit"""
+    # Callbacks of rolled back savepoints are discarded, so this is exactly the bumps still to come
+    return any(callback is _increment_generation for _, callback, _ in transaction.get_connection().run_on_commit)
+
+
+def catalogue_generation():
+    """Current catalogue generation, as committed in the database.
+
+    A writer whose catalogue change hasn't committed yet gets a generation of its
+    own instead, new with every bump, so it neither serves entries cached before
+    its change nor leaves entries holding uncommitted data under a shared one.
+    """
+    generation = _committed_generation()
+    if _bump_pending():
+        return f'{generation}.{os.getpid()}.{_local.pending}'
+    return generation
+
+
+def _increment_generation():
+    from a_reviews.models import CatalogueGeneration
+    if not CatalogueGeneration.objects.filter(pk=CatalogueGeneration.ROW).update(value=F('value') + 1):
+        # The migration creates the row, this only covers a database where it went missing
+        CatalogueGeneration.objects.get_or_create(pk=CatalogueGeneration.ROW, defaults={'value': 1})
+    _local.generation = None
+
+
+def bump_catalogue_generation():
+    """Retire everything cached against the catalogue once the current transaction commits.
+
+    Outside a transaction the generation is bumped straight away. Several bumps in
+    one transaction still write the row once.
+    """
+    _local.pending = next(_pending_bumps)
+    if not _bump_pending():
+        transaction.on_commit(_increment_generation)
+
+
+def canonical_params(params):
+    """Query string for a QueryDict with pagination dropped, keys sorted and values deduplicated"""
+    items = []
+    for key in sorted(params):
+        if key in PAGINATION_PARAMS:
+            continue
+        values = sorted({value for value in params.getlist(key) if value})
+        items.extend((key, value) for value in values)
+    return urlencode(items)
+
+
+def result_cache_key(prefix, params):
+    """Cache key for a result set, scoped to the current catalogue generation"""
+    digest = hashlib.md5(canonical_params(params).encode()).hexdigest()
+    return f'{prefix}:{catalogue_generation()}:{digest}'
+
+
+def course_code_key(code):
+    """Cache key mapping a course code to its pk"""
+    return f'course-code:{hashlib.md5(str(code).encode()).hexdigest()}'
+
+
+def course_key(pk):
+    """Cache key for a course row"""
+    return f'course:{pk}'
+
+
+def invalidate_courses(pks):
+    """Drop the cached rows of these courses, now and again on commit for readers that cached them in between"""
+    keys = [course_key(pk) for pk in pks]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
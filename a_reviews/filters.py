@@ -1,13 +1,21 @@
+import operator
+from functools import reduce
+
 import django_filters
 from django import forms
-from a_reviews.models import Course, Review
+from django.core.cache import cache
+from django.db.models import Count, Exists, OuterRef, Q
+from django.http import QueryDict
+from django_filters.constants import EMPTY_VALUES
+from a_reviews.caching import RESULT_CACHE_TIMEOUT, result_cache_key
+from a_reviews.models import Course, CourseSession, Review
+from a_reviews.search import fuzzy_search_courses, search_courses
 
 
 class CourseFilter(django_filters.FilterSet):
     # Search filter
     search = django_filters.CharFilter(
-        field_name='name',
-        lookup_expr='icontains',
+        method='filter_search',
         widget=forms.TextInput(attrs={
             'placeholder': 'Search courses...',
             'class': 'flex-1 bg-white dark:bg-gray-700 border border-gray-300 dark:border-gray-600 rounded-lg px-4 py-3 text-gray-900 dark:text-white placeholder-gray-500 dark:placeholder-gray-400 focus:outline-none focus:ring-2 focus:ring-blue-500 focus:border-transparent transition-all'
@@ -65,28 +73,120 @@ class CourseFilter(django_filters.FilterSet):
         }
     )
 
+    # Filters whose options show result counts in the filter modal
+    FACETS = ('faculty', 'session')
+
     class Meta:
         model = Course
         fields = ['search', 'faculty', 'session', 'sort']
 
 
 
+    def filter_search(self, queryset, name, value):
+        """Full-text search over code, name and description, best matches first.
+
+        Falls back to typo tolerant trigram matching when nothing matches exactly.
+        """
+        results = search_courses(queryset, value)
+        if results is queryset or results.exists():
+            return results
+        return fuzzy_search_courses(queryset, value)
+
     def filter_by_sessions(self, queryset, name, value):
-        """Custom filter method for JSONField sessions"""
+        """Courses offered in any of the selected sessions, as a single SQL predicate"""
         if not value:
             return queryset
-        
-        # Filter courses that have any of the selected sessions
-        course_ids = []
-        for course in queryset:
-            if any(session in course.sessions for session in value):
-                course_ids.append(course.id)
-        
-        return queryset.filter(id__in=course_ids)
+        return queryset.filter(self.session_condition(value))
+
+    def session_condition(self, value):
+        conditions = []
+        sessions = [session for session in value if session != 'Unavailable']
+        if sessions:
+            # Served by the (name, course) index on CourseSession
+            conditions.append(Exists(
+                CourseSession.objects.filter(course=OuterRef('pk'), name__in=sessions)
+            ))
+        if 'Unavailable' in value:
+            conditions.append(Q(has_sessions=False))
+        return reduce(operator.or_, conditions)
+
+    def facet_condition(self, name, value):
+        """Condition for courses matching a single option of a facet filter"""
+        if name == 'session':
+            return self.session_condition([value])
+        return Q(**{self.filters[name].field_name: value})
+
+    def facet_params(self):
+        """The filter data as a QueryDict, without the sort order (counts don't depend on it)"""
+        params = QueryDict(mutable=True)
+        for key in self.data:
+            if key == 'sort':
+                continue
+            values = self.data.getlist(key) if isinstance(self.data, QueryDict) else self.data[key]
+            params.setlist(key, values if isinstance(values, (list, tuple)) else [values])
+        return params
+
+    def facet_counts(self):
+        """
+        Result counts for every faculty and session option under the other active filters,
+        for the filter modal. One query per facet, cached per filter state until the
+        catalogue changes.
+        """
+        params = self.facet_params()
+        key = result_cache_key('course-facets', params)
+        facets = cache.get(key)
+        if facets is None:
+            facets = [self.count_facet(name, params) for name in self.FACETS]
+            cache.set(key, facets, RESULT_CACHE_TIMEOUT)
+        return facets
+
+    def count_facet(self, name, params):
+        # A facet's own selection doesn't narrow its counts, only the other filters do
+        others = params.copy()
+        others.pop(name, None)
+        matching = type(self)(others, queryset=self.queryset).qs
+        courses = self.queryset.model.objects.filter(pk__in=matching.order_by().values('pk'))
+
+        choices = self.filters[name].extra['choices']
+        counts = courses.aggregate(**{
+            f'option_{index}': Count('pk', filter=self.facet_condition(name, value))
+            for index, (value, label) in enumerate(choices)
+        })
+        selected = set(params.getlist(name))
+        return {
+            'name': name,
+            'label': name.title(),
+            'options': [
+                {'value': value, 'label': label, 'count': counts[f'option_{index}'], 'selected': value in selected}
+                for index, (value, label) in enumerate(choices)
+            ],
+        }
     
 
+class ReviewOrderingFilter(django_filters.OrderingFilter):
+    """OrderingFilter that sorts course_completion chronologically by its year and term columns"""
+
+    composite_fields = {
+        'course_completion': ('completion_year', 'completion_term_ordinal'),
+    }
+
+    def filter(self, qs, value):
+        if value in EMPTY_VALUES:
+            return qs
+
+        ordering = []
+        for param in value:
+            if param in EMPTY_VALUES:
+                continue
+            field = self.get_ordering_value(param)
+            sign = '-' if field.startswith('-') else ''
+            fields = self.composite_fields.get(field.lstrip('-'), (field.lstrip('-'),))
+            ordering.extend(f'{sign}{name}' for name in fields)
+        return qs.order_by(*ordering)
+
+
 class ReviewFilter(django_filters.FilterSet):
-    sort = django_filters.OrderingFilter(
+    sort = ReviewOrderingFilter(
         fields=(
             ('review_date', 'review_date'),
             ('course_completion', 'course_completion'),
@@ -100,6 +200,9 @@ class ReviewFilter(django_filters.FilterSet):
         }
     )
 
+    # Year the course was taken, as ?taken_min=2023&taken_max=2024
+    taken = django_filters.RangeFilter(field_name='completion_year')
+
     class Meta:
         model = Review
-        fields = ['sort']
\ No newline at end of file
+        fields = ['sort', 'taken']
\ No newline at end of file
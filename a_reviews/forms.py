@@ -110,10 +110,10 @@ class ReviewForm(forms.ModelForm):
 
     def save(self, commit=True):
         instance = super().save(commit=False)
-        # Combine year and session into the course_completion field
+        # Combine year and session into course_completion and its sortable year/term columns
         year = self.cleaned_data['completion_year']
         session = self.cleaned_data['completion_session']
-        instance.course_completion = f"{year}-{session}"
+        instance.set_completion(year, session)
         
         if commit:
             instance.save()
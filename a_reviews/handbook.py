@@ -0,0 +1,303 @@
+"""Streaming reader for UTS handbook exports.
+
+Exports can run to hundreds of megabytes, so read_handbook() never holds more
+than one course record (plus a read-ahead chunk) in memory. It understands the
+layouts import_courses has always accepted:
+
+- a top-level list of courses
+- an object whose ``subjects``, ``courses`` or ``data`` key holds the list
+- a single course object
+- newline-delimited JSON (or any run of concatenated values), one course each
+
+Records are yielded as they are decoded; a syntax error surfaces as a
+ValueError at the point it is reached, after the records before it.
+
+normalize_course() turns a record into Course field values. It and the
+import_courses --workers functions at the bottom only load the models when
+first used, so worker processes can import this module before Django is set up.
+"""
+import hashlib
+import json
+import queue
+from functools import cache
+
+import django
+
+# Seconds a --workers process waits on a full queue before checking whether the import stopped
+QUEUE_TIMEOUT = 1
+
+# Keys whose array holds the courses, when the export is wrapped in an object
+COURSE_ARRAY_KEYS = ('subjects', 'courses', 'data')
+
+# Characters read from the file at a time
+CHUNK_SIZE = 64 * 1024
+
+WHITESPACE = ' \t\n\r'
+
+# Characters at the end of the buffer in which a value or syntax error may only be the
+# chunk boundary cutting off a number, literal or escape sequence
+BUFFER_TAIL = 16
+
+HANDBOOK_URL = "https://coursehandbook.uts.edu.au"
+
+# Course columns a handbook value could overflow
+LIMITED_FIELDS = ('code', 'name', 'page_reference', 'faculty')
+
+# Imported values covered by a course's content_hash (has_sessions follows from sessions)
+FINGERPRINT_FIELDS = ('name', 'description', 'sessions', 'faculty', 'page_reference', 'level')
+
+
+class JSONStream:
+    """Decode JSON values one at a time from a text file, refilling a small buffer as needed"""
+
+    decoder = json.JSONDecoder()
+
+    def __init__(self, file, chunk_size=CHUNK_SIZE):
+        self.file = file
+        self.chunk_size = chunk_size
+        self.buffer = ''
+        self.pos = 0
+        self.eof = False
+
+    def fill(self, size=None):
+        """Read another chunk, dropping what has been consumed. False at end of file."""
+        chunk = self.file.read(size or self.chunk_size)
+        if not chunk:
+            self.eof = True
+            return False
+        self.buffer = self.buffer[self.pos:] + chunk
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """Next non-whitespace character without consuming it, '' at end of file"""
+        while True:
+            while self.pos < len(self.buffer) and self.buffer[self.pos] in WHITESPACE:
+                self.pos += 1
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                return ''
+
+    def expect(self, *chars):
+        """Consume the next character, which must be one of ``chars``, and return it"""
+        char = self.peek()
+        if char not in chars:
+            raise ValueError(f"Expected {' or '.join(map(repr, chars))}, found {char or 'end of file'!r}")
+        self.pos += 1
+        return char
+
+    def value(self):
+        """Decode and consume the next complete JSON value"""
+        self.peek()
+        size = self.chunk_size
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                # Only an error in the tail, or a string running into it, may be the end of the
+                # chunk rather than of the value. Anything else is a real error, reported now.
+                cut_off = e.pos >= len(self.buffer) - BUFFER_TAIL or e.msg.startswith('Unterminated string')
+                if not cut_off or not self.fill(size):
+                    raise
+            else:
+                # A value ending in the tail (a number, say) may continue in the next chunk
+                if end < len(self.buffer) - BUFFER_TAIL or not self.fill(size):
+                    self.pos = end
+                    return value
+            # Each retry reads twice as much, so a long value is decoded a handful of times, not once per chunk
+            size *= 2
+
+    def array(self):
+        """Yield the elements of the array starting here"""
+        self.expect('[')
+        if self.peek() == ']':
+            self.pos += 1
+            return
+        while True:
+            yield self.value()
+            if self.expect(',', ']') == ']':
+                return
+
+
+def expect_end(stream):
+    """Raise ValueError unless only whitespace is left in the stream"""
+    char = stream.peek()
+    if char:
+        raise ValueError(f"Unexpected {char!r} after the course array")
+
+
+def read_records(file, chunk_size=CHUNK_SIZE):
+    """Yield course records from an open handbook export"""
+    stream = JSONStream(file, chunk_size)
+    first = stream.peek()
+
+    if first == '[':
+        yield from stream.array()
+        expect_end(stream)
+        return
+
+    if first == '{':
+        # Walk the top-level object key by key, so a course array is streamed rather than decoded whole.
+        # The first course array found is used; other keys are small and just kept.
+        stream.pos += 1
+        fields = {}
+        if stream.peek() == '}':
+            stream.pos += 1
+        else:
+            while True:
+                key = stream.value()
+                stream.expect(':')
+                if key in COURSE_ARRAY_KEYS and stream.peek() == '[':
+                    yield from stream.array()
+                    # The rest of the object is still read, so a syntax error in it is reported
+                    while stream.expect(',', '}') == ',':
+                        stream.value()
+                        stream.expect(':')
+                        stream.value()
+                    expect_end(stream)
+                    return
+                fields[key] = stream.value()
+                if stream.expect(',', '}') == '}':
+                    break
+
+        # No course array, so the object is a course itself, possibly the first line of NDJSON
+        yield fields
+    elif first:
+        raise ValueError(f"Expected a JSON object or array, found {first!r}")
+
+    while stream.peek():
+        yield stream.value()
+
+
+def read_handbook(path, chunk_size=CHUNK_SIZE):
+    """Yield course records from the handbook export at ``path``"""
+    with open(path, 'r', encoding='utf-8') as file:
+        yield from read_records(file, chunk_size)
+
+
+@cache
+def field_limits():
+    """max_length of each LIMITED_FIELDS column"""
+    from a_reviews.models import Course
+    return {name: Course._meta.get_field(name).max_length for name in LIMITED_FIELDS}
+
+
+def record_text(course_item, key):
+    """A record's value for ``key`` as text: '' when missing or null, numbers as written"""
+    value = course_item.get(key)
+    if value is None:
+        return ''
+    if isinstance(value, (dict, list)):
+        raise ValueError(f"{key} is not text")
+    return str(value)
+
+
+def normalize_course(course_item, level):
+    """Course field values for one handbook record, raising ValueError if it can't be stored"""
+    if not isinstance(course_item, dict):
+        raise ValueError("record is not a JSON object")
+    # Exports sometimes carry codes as numbers, e.g. 41040
+    code = record_text(course_item, "code")
+    title = record_text(course_item, "title")
+    if not code or not title:
+        raise ValueError("missing code or title")
+
+    teaching_period = course_item.get("teachingPeriod", "")
+    fields = {
+        'code': code,
+        'name': title,
+        'description': record_text(course_item, "description"),
+        'page_reference': HANDBOOK_URL + record_text(course_item, "URL_MAP_FOR_CONTENT"),
+        'faculty': record_text(course_item, "educationalAreaDisplay"),
+        'sessions': teaching_period if teaching_period else [],
+        'level': level,
+        # Determine if course has sessions
+        'has_sessions': bool(teaching_period and len(teaching_period) > 0),
+    }
+
+    # Checked up front, a bulk write fails as a whole on one oversized value
+    for name, max_length in field_limits().items():
+        if len(fields[name]) > max_length:
+            raise ValueError(f"{code}: {name} is longer than {max_length} characters")
+
+    fields['content_hash'] = content_fingerprint(fields)
+    return fields
+
+
+def content_fingerprint(fields):
+    """Hash of the FINGERPRINT_FIELDS values, equal for records that would import identically"""
+    content = json.dumps([fields[name] for name in FINGERPRINT_FIELDS], separators=(',', ':'))
+    return hashlib.md5(content.encode()).hexdigest()
+
+
+# Set in each --workers process, the queue parsed records are sent back on and the
+# event the writer sets when it gives up on the import
+_records_queue = None
+_stop_event = None
+
+
+class ImportStopped(Exception):
+    """The writer stopped reading the records queue"""
+
+
+def init_parse_worker(records_queue, stop_event):
+    global _records_queue, _stop_event
+    # Spawned (rather than forked) workers start without Django configured
+    django.setup()
+    _records_queue = records_queue
+    _stop_event = stop_event
+    # Anything still buffered once the writer gives up is not wanted, and flushing it
+    # would keep this process from exiting
+    records_queue.cancel_join_thread()
+
+
+def send(message):
+    """Put a message on the records queue, raising ImportStopped if the writer has stopped"""
+    while not _stop_event.is_set():
+        try:
+            _records_queue.put(message, timeout=QUEUE_TIMEOUT)
+            return
+        except queue.Full:
+            continue
+    raise ImportStopped
+
+
+def parse_handbook_file(path, level, batch_size, skip=0):
+    """Worker side of --workers: stream one file's normalized records back in batch_size lists.
+
+    Sends (path, kind, payload) messages: 'records' with (records read so far, list of
+    field dicts), 'skipped' and 'error' with a message, and a final 'done' with the
+    number of records read, or None after an error. The first ``skip`` records are
+    read but not sent. Returns early, sending nothing more, once the writer stops.
+    """
+    batch = []
+    position = 0
+    error = None
+    try:
+        try:
+            for position, course_item in enumerate(read_handbook(path), start=1):
+                if position <= skip:
+                    continue
+                try:
+                    batch.append(normalize_course(course_item, level))
+                except ValueError as e:
+                    send((path, 'skipped', str(e)))
+                    continue
+
+                if len(batch) >= batch_size:
+                    send((path, 'records', (position, batch)))
+                    batch = []
+        except ImportStopped:
+            raise
+        except Exception as e:
+            error = str(e)
+
+        # Records are streamed, so those read before an error are still sent
+        if batch:
+            send((path, 'records', (position, batch)))
+        if error is not None:
+            send((path, 'error', error))
+        send((path, 'done', None if error is not None else position))
+    except ImportStopped:
+        pass
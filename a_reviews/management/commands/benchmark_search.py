@@ -0,0 +1,86 @@
+import random
+import statistics
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from a_reviews.filters import CourseFilter
+from a_reviews.models import Course
+from a_reviews.search import index_courses
+from django.conf import settings
+
+
+WORDS = [
+    'machine', 'learning', 'data', 'structures', 'software', 'engineering', 'network',
+    'security', 'database', 'systems', 'design', 'analysis', 'calculus', 'statistics',
+    'business', 'finance', 'marketing', 'law', 'health', 'biology', 'chemistry', 'physics',
+    'communication', 'project', 'management', 'introduction', 'advanced', 'principles',
+]
+
+QUERIES = [
+    'machne lerning', 'data structres', 'sofware enginering', 'netwrk securty',
+    'databse systms', 'COMP1', 'introducton to calculs', 'advnced statistcs',
+    'busines financ', 'projct managment',
+]
+
+
+class Command(BaseCommand):
+    help = 'Time typo-tolerant course searches against a synthetic catalogue (rolled back afterwards)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--courses',
+            type=int,
+            default=20000,
+            help='Number of synthetic courses to create (default: 20000)'
+        )
+        parser.add_argument(
+            '--runs',
+            type=int,
+            default=20,
+            help='Number of passes over the query set (default: 20)'
+        )
+
+    def handle(self, *args, **options):
+        rng = random.Random(42)
+        # Filler vocabulary so descriptions aren't made only of the topic words
+        filler = [''.join(rng.choices('abcdefghijklmnopqrstuvwxyz', k=rng.randint(4, 9))) for _ in range(3000)]
+
+        with transaction.atomic():
+            self.stdout.write(f"Creating {options['courses']} synthetic courses...")
+            courses = Course.objects.bulk_create([
+                Course(
+                    code=f"BENCH{i:05d}"[:10],
+                    name=' '.join(rng.sample(WORDS, 3)).title()[:50],
+                    description=' '.join(rng.choices(filler, k=40) + rng.sample(WORDS, 2)),
+                )
+                for i in range(options['courses'])
+            ], batch_size=1000)
+            index_courses(courses)
+
+            # Warm up lazily built indexes so the timings reflect steady state
+            self.run_query(QUERIES[0])
+
+            timings = []
+            for _ in range(options['runs']):
+                for query in QUERIES:
+                    start = time.perf_counter()
+                    self.run_query(query)
+                    timings.append((time.perf_counter() - start) * 1000)
+
+            transaction.set_rollback(True)
+
+        timings.sort()
+        p95 = timings[int(len(timings) * 0.95) - 1]
+        self.stdout.write(f"Queries run: {len(timings)}")
+        self.stdout.write(f"p50: {statistics.median(timings):.2f} ms")
+        self.stdout.write(f"p95: {p95:.2f} ms")
+        self.stdout.write(f"max: {timings[-1]:.2f} ms")
+
+        style = self.style.SUCCESS if p95 < 20 else self.style.WARNING
+        self.stdout.write(style(f"p95 {'within' if p95 < 20 else 'over'} the 20 ms budget"))
+
+    def run_query(self, query):
+        """Same work as one filter_courses request: filter, then fetch the first page"""
+        course_filter = CourseFilter({'search': query}, queryset=Course.objects.all())
+        return list(course_filter.qs[:settings.PAGE_SIZE])
@@ -1,8 +1,26 @@
-import json
-import os
+import multiprocessing
+import queue
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
 from django.core.management.base import BaseCommand
-from a_reviews.models import Course
+from django.db import transaction
+from a_reviews.caching import bump_catalogue_generation, invalidate_courses
+from a_reviews.handbook import init_parse_worker, normalize_course, parse_handbook_file, read_handbook
+from a_reviews.models import Course, ImportCheckpoint, deferred_rating_updates
+from a_reviews.search import unindex_courses
+
+# Files picked up by --folder
+HANDBOOK_PATTERNS = ('*.json', '*.ndjson', '*.jsonl')
+
+# Courses written per INSERT ... ON CONFLICT statement and transaction
+DEFAULT_BATCH_SIZE = 500
+
+
+def add_counts(totals, counts):
+    """Add (created, changed, unchanged) counts into the running ``totals`` list"""
+    for index, count in enumerate(counts):
+        totals[index] += count
+
 
 class Command(BaseCommand):
     help = "Import courses from a JSON file/folder or delete courses"
@@ -44,76 +62,139 @@ class Command(BaseCommand):
             action='store_true',
             help='Import courses as postgraduate level (default is undergraduate)'
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=1,
+            help='Processes parsing --folder files in parallel, writes stay in this process (default 1)'
+        )
+        parser.add_argument(
+            '--resume',
+            action='store_true',
+            help='Continue an interrupted --folder import, skipping files and batches already committed'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=DEFAULT_BATCH_SIZE,
+            help=f'Courses written per transaction (default {DEFAULT_BATCH_SIZE})'
+        )
 
     def load_courses_from_file(self, file_path):
-        """Load courses from a single JSON file."""
+        """Stream course records from a single JSON or newline-delimited JSON file."""
+        return read_handbook(file_path)
+
+    def import_courses_from_data(self, courses_data, level, source_name="", batch_size=DEFAULT_BATCH_SIZE,
+                                 checkpoint=None):
+        """Import courses from data list, upserting them batch_size at a time.
+
+        With an ImportCheckpoint, records it has already seen are skipped and its
+        progress is committed along with each batch. Returns the (created, changed,
+        unchanged) counts.
+        """
+        counts = [0, 0, 0]
+        batch = []
+        skip = checkpoint.records if checkpoint else 0
+        position = 0
+        failed = False
+
+        def write_batch(completed=False):
+            with transaction.atomic():
+                if batch:
+                    add_counts(counts, Course.bulk_upsert(batch))
+                if checkpoint:
+                    checkpoint.advance(position, completed)
+            batch.clear()
+
         try:
-            with open(file_path, 'r', encoding='utf-8') as f:
-                data = json.load(f)
-            
-            # Handle different JSON structures
-            if isinstance(data, list):
-                return data
-            elif isinstance(data, dict):
-                if 'subjects' in data:
-                    return data['subjects']
-                elif 'courses' in data:
-                    return data['courses']
-                elif 'data' in data and isinstance(data['data'], list):
-                    return data['data']
-                else:
-                    return [data]  # Single course as dict
-            
-            return []
-        except Exception as e:
-            self.stderr.write(f"Error reading {file_path}: {e}")
-            return []
-
-    def import_courses_from_data(self, courses_data, level, level_display, source_name=""):
-        """Import courses from data list."""
-        created_count = 0
-        updated_count = 0
-        
-        for course_item in courses_data:
-            code = course_item.get("code")
-            title = course_item.get("title")
-            
-            if not code or not title:
-                self.stderr.write(f"Skipping invalid course in {source_name}: missing code or title")
-                continue
-                
-            description = course_item.get("description", "")
-            teaching_period = course_item.get("teachingPeriod", "")
-            base_url = "https://coursehandbook.uts.edu.au"
-            url_path = course_item.get("URL_MAP_FOR_CONTENT", "")
-            full_url = base_url + url_path
-            faculty = course_item.get("educationalAreaDisplay", "")
-            
-            # Determine if course has sessions
-            has_sessions = bool(teaching_period and len(teaching_period) > 0)
-
-            # Create or update the Course
-            course, created = Course.objects.update_or_create(
-                code=code,
-                defaults={
-                    'name': title,
-                    'description': description,
-                    'page_reference': full_url,
-                    'faculty': faculty,
-                    'sessions': teaching_period if teaching_period else [],
-                    'level': level,
-                    'has_sessions': has_sessions,
-                }
-            )
-
-            if created:
-                created_count += 1
-                self.stdout.write(self.style.SUCCESS(f"Created {level_display} course {code} - {title} (has_sessions: {has_sessions})"))
-            else:
-                updated_count += 1
-                self.stdout.write(self.style.WARNING(f"Updated {level_display} course {code} - {title} (has_sessions: {has_sessions})"))
-        
-        return created_count, updated_count
+            for position, course_item in enumerate(courses_data, start=1):
+                if position <= skip:
+                    continue
+                try:
+                    batch.append(Course(**normalize_course(course_item, level)))
+                except ValueError as e:
+                    self.stderr.write(f"Skipping invalid course in {source_name}: {e}")
+                    continue
+
+                if len(batch) >= batch_size:
+                    write_batch()
+        except (OSError, ValueError) as e:
+            # Records are streamed, so everything before the error is still imported
+            failed = True
+            self.stderr.write(f"Error reading {source_name}: {e}")
+
+        if batch or (checkpoint and not failed):
+            write_batch(completed=not failed)
+
+        return tuple(counts)
+
+    def import_files_in_parallel(self, checkpoints, level, batch_size, workers):
+        """Parse files in a process pool and write their records here as they arrive.
+
+        ``checkpoints`` maps each file to its ImportCheckpoint. Yields (file name,
+        (created, changed, unchanged)) as each file finishes. A bounded queue keeps
+        parsers from running ahead of the writer.
+        """
+        records_queue = multiprocessing.Queue(maxsize=workers * 2)
+        stop_event = multiprocessing.Event()
+        checkpoints = {str(path): checkpoint for path, checkpoint in checkpoints.items()}
+        counts = {path: [0, 0, 0] for path in checkpoints}
+
+        with ProcessPoolExecutor(workers, initializer=init_parse_worker, initargs=(records_queue, stop_event)) as pool:
+            futures = [
+                pool.submit(parse_handbook_file, path, level, batch_size, checkpoint.records)
+                for path, checkpoint in checkpoints.items()
+            ]
+            try:
+                remaining = len(futures)
+                while remaining:
+                    try:
+                        path, kind, payload = records_queue.get(timeout=1)
+                    except queue.Empty:
+                        # A worker that died outright never sends 'done', surface its error instead of waiting
+                        for future in futures:
+                            if future.done():
+                                future.result()
+                        continue
+
+                    name = Path(path).name
+                    if kind == 'records':
+                        position, records = payload
+                        with transaction.atomic():
+                            add_counts(counts[path], Course.bulk_upsert([Course(**fields) for fields in records]))
+                            checkpoints[path].advance(position)
+                    elif kind == 'skipped':
+                        self.stderr.write(f"Skipping invalid course in {name}: {payload}")
+                    elif kind == 'error':
+                        # Records are streamed, so everything before the error is still imported
+                        self.stderr.write(f"Error reading {name}: {payload}")
+                    else:
+                        remaining -= 1
+                        if payload is not None:
+                            checkpoints[path].advance(payload, completed=True)
+                        yield name, tuple(counts[path])
+            except BaseException:
+                # Leaving the with block waits for the workers, which would otherwise sit
+                # blocked on a queue nobody reads any more
+                stop_event.set()
+                for future in futures:
+                    future.cancel()
+                raise
+
+    def clear_import_journal(self):
+        """Forget every file's import progress, so a later --resume re-imports deleted courses.
+
+        The journal doesn't record which courses came from which file, so any deletion
+        clears all of it.
+        """
+        ImportCheckpoint.objects.all().delete()
+
+    def report_file(self, name, counts):
+        created, changed, unchanged = counts
+        if any(counts):
+            self.stdout.write(f"  -> {created} created, {changed} changed, {unchanged} unchanged from {name}")
+        else:
+            self.stdout.write(self.style.WARNING(f"  -> No valid courses found in {name}"))
 
     def handle(self, *args, **options):
         # Handle deletion by faculty/level
@@ -147,8 +228,14 @@ class Command(BaseCommand):
             
             self.stdout.write(f"Found {count} courses matching {' and '.join(filter_description)}")
             
-            # Delete the courses
-            courses_to_delete.delete()
+            # Delete the courses (cascaded reviews settle each course's ratings once)
+            deleted_ids = list(courses_to_delete.values_list('pk', flat=True))
+            with deferred_rating_updates():
+                courses_to_delete.delete()
+            unindex_courses(deleted_ids)
+            bump_catalogue_generation()
+            invalidate_courses(deleted_ids)
+            self.clear_import_journal()
             self.stdout.write(self.style.SUCCESS(f"Deleted {count} courses."))
             
             # Exit if only deleting
@@ -157,7 +244,13 @@ class Command(BaseCommand):
 
         # Handle deletion of all courses
         if options['delete_all']:
-            count, _ = Course.objects.all().delete()
+            deleted_ids = list(Course.objects.values_list('pk', flat=True))
+            with deferred_rating_updates():
+                count, _ = Course.objects.all().delete()
+            unindex_courses(deleted_ids)
+            bump_catalogue_generation()
+            invalidate_courses(deleted_ids)
+            self.clear_import_journal()
             self.stdout.write(self.style.SUCCESS(f"Deleted {count} courses from the database."))
             # Exit if only deleting
             if not options['file'] and not options['folder']:
@@ -172,12 +265,19 @@ class Command(BaseCommand):
             self.stderr.write("Please provide either --file OR --folder, not both")
             return
 
+        if options['batch_size'] < 1:
+            self.stderr.write("--batch-size must be at least 1")
+            return
+
+        if options['workers'] < 1:
+            self.stderr.write("--workers must be at least 1")
+            return
+
         # Determine the level based on the postgrad flag
         level = 'PG' if options['postgrad'] else 'UG'
         level_display = 'Postgraduate' if options['postgrad'] else 'Undergraduate'
         
-        total_created = 0
-        total_updated = 0
+        totals = [0, 0, 0]
         
         if options['file']:
             # Import single file
@@ -185,12 +285,9 @@ class Command(BaseCommand):
             self.stdout.write(f"Importing courses from {file_path} as {level_display} level...")
             
             courses_data = self.load_courses_from_file(file_path)
-            if courses_data:
-                created, updated = self.import_courses_from_data(
-                    courses_data, level, level_display, file_path
-                )
-                total_created += created
-                total_updated += updated
+            add_counts(totals, self.import_courses_from_data(
+                courses_data, level, file_path, options['batch_size']
+            ))
         
         elif options['folder']:
             # Import all JSON files in folder
@@ -204,8 +301,8 @@ class Command(BaseCommand):
                 self.stderr.write(f"Path is not a directory: {folder_path}")
                 return
             
-            # Find all JSON files
-            json_files = list(folder_path.glob('*.json'))
+            # Find all JSON and newline-delimited JSON files
+            json_files = sorted(path for pattern in HANDBOOK_PATTERNS for path in folder_path.glob(pattern))
             
             if not json_files:
                 self.stderr.write(f"No JSON files found in folder: {folder_path}")
@@ -213,23 +310,41 @@ class Command(BaseCommand):
             
             self.stdout.write(f"Found {len(json_files)} JSON files in {folder_path}")
             self.stdout.write(f"Importing courses as {level_display} level...")
-            
+
+            # Journal progress per file, so an interrupted import can pick up with --resume
+            checkpoints = {}
             for json_file in json_files:
-                self.stdout.write(f"\nProcessing: {json_file.name}")
-                
-                courses_data = self.load_courses_from_file(json_file)
-                if courses_data:
-                    created, updated = self.import_courses_from_data(
-                        courses_data, level, level_display, json_file.name
+                checkpoint = ImportCheckpoint.start(json_file, level, resume=options['resume'])
+                if checkpoint.completed:
+                    self.stdout.write(f"Skipping {json_file.name}, already imported")
+                    continue
+                if checkpoint.records:
+                    self.stdout.write(f"Resuming {json_file.name} after {checkpoint.records} records")
+                checkpoints[json_file] = checkpoint
+
+            if options['workers'] > 1 and len(checkpoints) > 1:
+                self.stdout.write(f"Parsing with {options['workers']} workers...")
+                for name, counts in self.import_files_in_parallel(
+                    checkpoints, level, options['batch_size'], options['workers']
+                ):
+                    self.stdout.write(f"\nProcessed: {name}")
+                    self.report_file(name, counts)
+                    add_counts(totals, counts)
+            else:
+                for json_file, checkpoint in checkpoints.items():
+                    self.stdout.write(f"\nProcessing: {json_file.name}")
+
+                    courses_data = self.load_courses_from_file(json_file)
+                    counts = self.import_courses_from_data(
+                        courses_data, level, json_file.name, options['batch_size'], checkpoint
                     )
-                    total_created += created
-                    total_updated += updated
-                    self.stdout.write(f"  -> {created} created, {updated} updated from {json_file.name}")
-                else:
-                    self.stdout.write(self.style.WARNING(f"  -> No valid courses found in {json_file.name}"))
+                    add_counts(totals, counts)
+                    self.report_file(json_file.name, counts)
 
         # Final summary
         self.stdout.write(self.style.SUCCESS(f"\nImport complete!"))
+        total_created, total_changed, total_unchanged = totals
         self.stdout.write(f"Total courses created: {total_created}")
-        self.stdout.write(f"Total courses updated: {total_updated}")
-        self.stdout.write(f"Total courses processed: {total_created + total_updated}")
\ No newline at end of file
+        self.stdout.write(f"Total courses changed: {total_changed}")
+        self.stdout.write(f"Total courses unchanged: {total_unchanged}")
+        self.stdout.write(f"Total courses processed: {sum(totals)}")
\ No newline at end of file
@@ -0,0 +1,108 @@
+import math
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum
+from django.db.models.functions import Now
+from a_reviews.caching import bump_catalogue_generation, invalidate_courses
+from a_reviews.models import Course, CourseRatingHistogram, Review, RATING_FIELDS
+
+
+class Command(BaseCommand):
+    help = 'Rebuild the cached rating averages, sums, review counts and star histograms on every course'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--verify',
+            action='store_true',
+            help='Report courses whose cached ratings have drifted without writing anything'
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Number of courses written per UPDATE batch (default: 1000)'
+        )
+
+    def handle(self, *args, **options):
+        histogram_columns = CourseRatingHistogram.columns()
+
+        # One grouped aggregate over all reviews instead of several queries per course
+        totals = {
+            row.pop('course_id'): row
+            for row in Review.objects.order_by().values('course_id').annotate(
+                count=Count('id'),
+                **{f'{field}_sum': Sum(field) for field in RATING_FIELDS},
+                **CourseRatingHistogram.count_aggregates()
+            )
+        }
+        histograms = CourseRatingHistogram.objects.in_bulk()
+
+        empty = {'count': 0}
+        drifted = []
+        drifted_histograms = []
+        new_histograms = []
+        fields = None
+        courses = Course.objects.order_by().only(
+            'code', 'level', 'has_sessions', 'review_count', 'rank_score',
+            *RATING_FIELDS, *(f'{field}_sum' for field in RATING_FIELDS)
+        )
+
+        for course in courses.iterator(chunk_size=options['batch_size']):
+            row = dict(totals.get(course.id, empty))
+            expected_counts = {column: row.pop(column, 0) for column in histogram_columns}
+            sums = {field: row.get(f'{field}_sum') for field in RATING_FIELDS}
+            expected = course.derive_ratings(row['count'], sums)
+            fields = fields or list(expected)
+
+            changes = {
+                field: (getattr(course, field), value)
+                for field, value in expected.items()
+                if not math.isclose(getattr(course, field), value, abs_tol=1e-9)
+            }
+
+            histogram = histograms.get(course.id)
+            if histogram is None:
+                if any(expected_counts.values()):
+                    changes['histogram'] = ('missing', 'rebuilt')
+                    new_histograms.append(CourseRatingHistogram(course_id=course.id, **expected_counts))
+            elif any(getattr(histogram, column) != count for column, count in expected_counts.items()):
+                changes['histogram'] = ('stale', 'rebuilt')
+                for column, count in expected_counts.items():
+                    setattr(histogram, column, count)
+                drifted_histograms.append(histogram)
+
+            if not changes:
+                continue
+
+            if options['verify']:
+                details = ', '.join(f"{field}: {old} -> {new}" for field, (old, new) in changes.items())
+                self.stdout.write(self.style.WARNING(f"  {course.code}: {details}"))
+
+            for field, value in expected.items():
+                setattr(course, field, value)
+            course.version = F('version') + 1
+            course.updated_at = Now()
+            drifted.append(course)
+
+        if options['verify']:
+            if drifted:
+                self.stdout.write(self.style.WARNING(f"{len(drifted)} courses have drifted ratings."))
+            else:
+                self.stdout.write(self.style.SUCCESS("All course ratings are up to date."))
+            return
+
+        with transaction.atomic():
+            if drifted:
+                Course.objects.bulk_update(drifted, [*fields, 'version', 'updated_at'], batch_size=options['batch_size'])
+            if drifted_histograms:
+                CourseRatingHistogram.objects.bulk_update(
+                    drifted_histograms, histogram_columns, batch_size=options['batch_size']
+                )
+            if new_histograms:
+                CourseRatingHistogram.objects.bulk_create(new_histograms, batch_size=options['batch_size'])
+            if drifted:
+                bump_catalogue_generation()
+                invalidate_courses([course.pk for course in drifted])
+
+        self.stdout.write(self.style.SUCCESS(f"Recomputed ratings, {len(drifted)} courses updated."))
@@ -0,0 +1,62 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:03
+
+from django.db import migrations, models
+from django.db.models import Count, Sum
+
+
+RATING_FIELDS = ('overall_rating', 'enjoyment', 'usefullness', 'manageability')
+
+
+def backfill_rating_sums(apps, schema_editor):
+    Course = apps.get_model('a_reviews', 'Course')
+    Review = apps.get_model('a_reviews', 'Review')
+
+    totals = Review.objects.values('course_id').annotate(
+        count=Count('id'),
+        **{f'{field}_sum': Sum(field) for field in RATING_FIELDS}
+    )
+    for row in totals:
+        Course.objects.filter(pk=row['course_id']).update(
+            review_count=row['count'],
+            **{f'{field}_sum': row[f'{field}_sum'] for field in RATING_FIELDS}
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0012_alter_course_options_course_level'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='course',
+            options={'ordering': [models.Case(models.When(level='UG', then=1), models.When(level='PG', then=2), output_field=models.IntegerField()), '-has_sessions', '-overall_rating', '-review_count']},
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='enjoyment_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='manageability_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='overall_rating_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='usefullness_sum',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AlterField(
+            model_name='review',
+            name='title',
+            field=models.CharField(blank=True, max_length=100, null=True),
+        ),
+        migrations.RunPython(backfill_rating_sums, migrations.RunPython.noop),
+    ]
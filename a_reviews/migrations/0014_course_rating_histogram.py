@@ -0,0 +1,58 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:07
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Q
+
+
+RATING_FIELDS = ('overall_rating', 'enjoyment', 'usefullness', 'manageability')
+
+
+def backfill_histograms(apps, schema_editor):
+    Review = apps.get_model('a_reviews', 'Review')
+    CourseRatingHistogram = apps.get_model('a_reviews', 'CourseRatingHistogram')
+
+    counts = Review.objects.order_by().values('course_id').annotate(**{
+        f'{field}_{stars}': Count('id', filter=Q(**{field: stars}))
+        for field in RATING_FIELDS for stars in range(1, 6)
+    })
+    CourseRatingHistogram.objects.bulk_create(
+        [CourseRatingHistogram(**row) for row in counts], batch_size=500
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0013_course_rating_sums'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseRatingHistogram',
+            fields=[
+                ('course', models.OneToOneField(on_delete=django.db.models.deletion.CASCADE, primary_key=True, related_name='histogram', serialize=False, to='a_reviews.course')),
+                ('overall_rating_1', models.PositiveIntegerField(default=0)),
+                ('overall_rating_2', models.PositiveIntegerField(default=0)),
+                ('overall_rating_3', models.PositiveIntegerField(default=0)),
+                ('overall_rating_4', models.PositiveIntegerField(default=0)),
+                ('overall_rating_5', models.PositiveIntegerField(default=0)),
+                ('enjoyment_1', models.PositiveIntegerField(default=0)),
+                ('enjoyment_2', models.PositiveIntegerField(default=0)),
+                ('enjoyment_3', models.PositiveIntegerField(default=0)),
+                ('enjoyment_4', models.PositiveIntegerField(default=0)),
+                ('enjoyment_5', models.PositiveIntegerField(default=0)),
+                ('usefullness_1', models.PositiveIntegerField(default=0)),
+                ('usefullness_2', models.PositiveIntegerField(default=0)),
+                ('usefullness_3', models.PositiveIntegerField(default=0)),
+                ('usefullness_4', models.PositiveIntegerField(default=0)),
+                ('usefullness_5', models.PositiveIntegerField(default=0)),
+                ('manageability_1', models.PositiveIntegerField(default=0)),
+                ('manageability_2', models.PositiveIntegerField(default=0)),
+                ('manageability_3', models.PositiveIntegerField(default=0)),
+                ('manageability_4', models.PositiveIntegerField(default=0)),
+                ('manageability_5', models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(backfill_histograms, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:10
+
+from django.db import migrations, models
+from django.db.models import Case, F, FloatField, Value, When
+from django.db.models.functions import Cast
+
+
+def backfill_rank_score(apps, schema_editor):
+    # Mirrors Course.rank_score_expression() as of this migration
+    Course = apps.get_model('a_reviews', 'Course')
+    Course.objects.update(rank_score=(
+        Case(When(level='UG', then=Value(20.0)), default=Value(0.0), output_field=FloatField())
+        + Case(When(has_sessions=True, then=Value(10.0)), default=Value(0.0), output_field=FloatField())
+        + (Value(15.0) + Cast(F('overall_rating_sum'), FloatField())) / (Value(5.0) + F('review_count'))
+    ))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0014_course_rating_histogram'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='course',
+            options={'ordering': ['-rank_score', 'code']},
+        ),
+        migrations.AddField(
+            model_name='course',
+            name='rank_score',
+            field=models.FloatField(default=0.0),
+        ),
+        migrations.AddIndex(
+            model_name='course',
+            index=models.Index(fields=['-rank_score', 'code'], name='course_rank_idx'),
+        ),
+        migrations.RunPython(backfill_rank_score, migrations.RunPython.noop),
+    ]
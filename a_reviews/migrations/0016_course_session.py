@@ -0,0 +1,38 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+def backfill_course_sessions(apps, schema_editor):
+    Course = apps.get_model('a_reviews', 'Course')
+    CourseSession = apps.get_model('a_reviews', 'CourseSession')
+
+    rows = []
+    for course_id, sessions in Course.objects.order_by().values_list('id', 'sessions').iterator():
+        names = {str(session).strip()[:100] for session in sessions or [] if session and str(session).strip()}
+        rows.extend(CourseSession(course_id=course_id, name=name) for name in names)
+    CourseSession.objects.bulk_create(rows, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0015_course_rank_score'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CourseSession',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100)),
+                ('course', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='session_rows', to='a_reviews.course')),
+            ],
+            options={
+                'indexes': [models.Index(fields=['name', 'course'], name='course_session_name_idx')],
+                'unique_together': {('course', 'name')},
+            },
+        ),
+        migrations.RunPython(backfill_course_sessions, migrations.RunPython.noop),
+    ]
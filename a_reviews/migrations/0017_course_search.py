@@ -0,0 +1,59 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:40
+
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    """
+    ALTER TABLE a_reviews_course ADD COLUMN search_vector tsvector GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(code, '')), 'A')
+        || setweight(to_tsvector('english', coalesce(name, '')), 'B')
+        || setweight(to_tsvector('english', coalesce(description, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX course_search_idx ON a_reviews_course USING gin (search_vector)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS course_search_idx",
+    "ALTER TABLE a_reviews_course DROP COLUMN IF EXISTS search_vector",
+]
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE a_reviews_course_fts USING fts5(
+        code, name, description, tokenize = 'unicode61 remove_diacritics 2', prefix = '2 3'
+    )
+    """,
+    """
+    INSERT INTO a_reviews_course_fts (rowid, code, name, description)
+    SELECT id, code, name, description FROM a_reviews_course
+    """,
+]
+SQLITE_REVERSE = [
+    "DROP TABLE IF EXISTS a_reviews_course_fts",
+]
+
+
+def run_for_vendor(postgres_sql, sqlite_sql):
+    def run(apps, schema_editor):
+        statements = {
+            'postgresql': postgres_sql,
+            'sqlite': sqlite_sql,
+        }.get(schema_editor.connection.vendor, [])
+        for statement in statements:
+            schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0016_course_session'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_for_vendor(POSTGRES_FORWARD, SQLITE_FORWARD),
+            run_for_vendor(POSTGRES_REVERSE, SQLITE_REVERSE),
+        ),
+    ]
@@ -0,0 +1,37 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:05
+
+from django.db import migrations
+
+
+POSTGRES_FORWARD = [
+    "CREATE EXTENSION IF NOT EXISTS pg_trgm",
+    "CREATE INDEX course_name_trgm_idx ON a_reviews_course USING gin (name gin_trgm_ops)",
+    "CREATE INDEX course_code_trgm_idx ON a_reviews_course USING gin (code gin_trgm_ops)",
+]
+POSTGRES_REVERSE = [
+    "DROP INDEX IF EXISTS course_code_trgm_idx",
+    "DROP INDEX IF EXISTS course_name_trgm_idx",
+]
+
+
+def run_on_postgres(statements):
+    # Other backends use the in-process trigram index in a_reviews/search.py
+    def run(apps, schema_editor):
+        if schema_editor.connection.vendor == 'postgresql':
+            for statement in statements:
+                schema_editor.execute(statement)
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0017_course_search'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_on_postgres(POSTGRES_FORWARD),
+            run_on_postgres(POSTGRES_REVERSE),
+        ),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.2.1 on 2026-10-18 13:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+# Snapshot of a_reviews.models.COMPLETION_TERMS at the time of this migration
+COMPLETION_TERMS = {'AUTUMN': 1, 'JULY': 2, 'SPRING': 3, 'SUMMER': 4}
+
+
+def backfill_completion_terms(apps, schema_editor):
+    Review = apps.get_model('a_reviews', 'Review')
+
+    reviews = []
+    for review in Review.objects.order_by().only('id', 'course_completion').iterator():
+        year, _, session = (review.course_completion or '').partition('-')
+        review.completion_year = int(year) if year.strip().isdigit() and len(year.strip()) <= 4 else 0
+        review.completion_term_ordinal = COMPLETION_TERMS.get(session.strip().upper(), 0)
+        reviews.append(review)
+    Review.objects.bulk_update(reviews, ['completion_year', 'completion_term_ordinal'], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0019_review_feed_indexes'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name='review',
+            name='review_course_completion_idx',
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='completion_term_ordinal',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='review',
+            name='completion_year',
+            field=models.PositiveSmallIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='review',
+            index=models.Index(fields=['course', 'completion_year', 'completion_term_ordinal', 'id'], name='review_course_term_idx'),
+        ),
+        migrations.RunPython(backfill_completion_terms, migrations.RunPython.noop),
+    ]
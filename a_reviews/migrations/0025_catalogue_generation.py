@@ -0,0 +1,29 @@
+# Generated by Django 5.2.1 on 2026-10-18 14:25
+
+import time
+
+from django.db import migrations, models
+
+
+def create_generation_row(apps, schema_editor):
+    # Seeded from the clock so a rebuilt database never repeats a generation still in a cache
+    CatalogueGeneration = apps.get_model('a_reviews', 'CatalogueGeneration')
+    CatalogueGeneration.objects.using(schema_editor.connection.alias).create(pk=1, value=time.time_ns())
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('a_reviews', '0024_import_checkpoint'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CatalogueGeneration',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('value', models.BigIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(create_generation_row, migrations.RunPython.noop),
+    ]
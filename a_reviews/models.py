@@ -1,11 +1,115 @@
-from django.db import models
-from django.db.models import Avg
+import threading
+from contextlib import contextmanager
+from decimal import Decimal, ROUND_HALF_UP
+from pathlib import Path
+
+from django.db import IntegrityError, models, transaction
+from django.db.models import Count, F, FloatField, Sum, Value
+from django.db.models.functions import Cast, Coalesce, Now, NullIf, Round
 from django.contrib.auth.models import User
 from django.core.validators import MaxValueValidator, MinValueValidator
-from django.db.models import Case, When, IntegerField
+from django.db.models import Case, When
+from a_reviews.caching import bump_catalogue_generation, invalidate_courses
+from a_reviews.search import index_courses, unindex_courses
 
 # Create your models here.
 
+# Rating dimensions shared by Review (1-5 score) and Course (cached average + running sum)
+RATING_FIELDS = ('overall_rating', 'enjoyment', 'usefullness', 'manageability')
+
+STAR_VALUES = range(1, 6)
+
+# Bayesian ranking: every course starts with RANK_PRIOR_WEIGHT virtual reviews of
+# RANK_PRIOR_MEAN stars, so a handful of 5-star reviews can't outrank a large, well-rated course
+RANK_PRIOR_MEAN = 3.0
+RANK_PRIOR_WEIGHT = 5
+
+# rank_score offsets that keep UG before PG and offered courses before unavailable ones
+RANK_LEVEL_BONUS = {'UG': 20.0, 'PG': 0.0}
+RANK_SESSIONS_BONUS = 10.0
+
+# Course columns that feed into rank_score
+RANK_INPUT_FIELDS = ('level', 'has_sessions', 'overall_rating_sum', 'review_count')
+
+# Course columns covered by the full-text search index (see a_reviews/search.py)
+SEARCH_FIELDS = ('code', 'name', 'description')
+
+# Chronological position of each teaching session within its year. Summer runs over the
+# new year, so it comes last; unrecognised sessions ("Other") sort first.
+COMPLETION_TERMS = {'AUTUMN': 1, 'JULY': 2, 'SPRING': 3, 'SUMMER': 4}
+
+# Course columns whose stored values are remembered so save() can tell when derived data is stale
+TRACKED_FIELDS = ('sessions', *SEARCH_FIELDS)
+
+# Course columns written by the handbook import, everything else is derived or review driven
+IMPORTED_FIELDS = ('name', 'description', 'page_reference', 'faculty', 'sessions', 'level', 'has_sessions')
+
+
+def rating_changes(scores, sign=1):
+    """Map a review's scores to the sum and histogram changes of adding (sign=1) or removing (sign=-1) it"""
+    changes = {}
+    for field in RATING_FIELDS:
+        value = scores[field]
+        changes[field] = sign * value
+        if value in STAR_VALUES:
+            changes[f'{field}_{value}'] = sign
+    return changes
+
+
+# Per-thread buffer of rating deltas while inside deferred_rating_updates()
+_deferred = threading.local()
+
+
+@contextmanager
+def deferred_rating_updates():
+    """Coalesce rating deltas issued inside the block into one UPDATE per course.
+
+    Deltas are buffered per course and flushed when the outermost block exits,
+    still inside its transaction, so a cascade that removes many reviews costs
+    one write per affected course. Nested blocks join the outer one.
+    """
+    if getattr(_deferred, 'pending', None) is not None:
+        yield
+        return
+
+    _deferred.pending = {}
+    try:
+        with transaction.atomic():
+            yield
+            pending, _deferred.pending = _deferred.pending, None
+            for course_id, (count, changes) in pending.items():
+                if count or any(changes.values()):
+                    Course.apply_rating_delta(course_id, count, **changes)
+    finally:
+        _deferred.pending = None
+
+
+def record_rating_delta(course_id, count, **changes):
+    """Apply a rating delta now, or buffer it when inside deferred_rating_updates()"""
+    pending = getattr(_deferred, 'pending', None)
+    if pending is None:
+        Course.apply_rating_delta(course_id, count, **changes)
+        return
+
+    total_count, total_changes = pending.get(course_id, (0, {}))
+    for column, change in changes.items():
+        total_changes[column] = total_changes.get(column, 0) + change
+    pending[course_id] = (total_count + count, total_changes)
+
+
+class CourseQuerySet(models.QuerySet):
+
+    # What course_list.html renders, its cache key, and every column the feed can be sorted by
+    LIST_FIELDS = (
+        'id', 'code', 'name', 'level', 'sessions', 'review_count', 'version',
+        'rank_score', *RATING_FIELDS,
+    )
+
+    def for_list(self):
+        """Courses for the card list: large columns such as description are left unloaded"""
+        return self.only(*self.LIST_FIELDS)
+
+
 class Course(models.Model):
     code = models.CharField(max_length=10, unique=True)
     name = models.CharField(max_length=50)
@@ -15,6 +119,11 @@ class Course(models.Model):
     manageability = models.FloatField(default=0.0)
     overall_rating = models.FloatField(default=0.0)
     review_count = models.PositiveIntegerField(default=0)  # Add this line
+    # Running totals of the review scores, averages above are derived from these
+    overall_rating_sum = models.PositiveIntegerField(default=0)
+    enjoyment_sum = models.PositiveIntegerField(default=0)
+    usefullness_sum = models.PositiveIntegerField(default=0)
+    manageability_sum = models.PositiveIntegerField(default=0)
     sessions = models.JSONField(default=list)
     page_reference = models.URLField(max_length=200, blank=True, null=True)
     faculty = models.CharField(max_length=50, blank=True, null=True)
@@ -24,6 +133,15 @@ class Course(models.Model):
     ('PG', 'Postgraduate'),
     ]
     level = models.CharField(max_length=2, choices=LEVEL_CHOICES, default='UG', db_index=True)
+    # Level/session precedence plus a confidence-weighted overall rating, see compute_rank_score()
+    rank_score = models.FloatField(default=0.0)
+    # Bumped by every write to the row, so anything rendered from a course can be cached against it
+    version = models.PositiveIntegerField(default=1)
+    updated_at = models.DateTimeField(auto_now=True)
+    # Fingerprint of the handbook record last imported into this row, blank once the row is edited
+    content_hash = models.CharField(max_length=32, blank=True, default='')
+
+    objects = CourseQuerySet.as_manager()
 
     def __str__(self):
         return f"{self.code} - {self.name}"
@@ -32,53 +150,273 @@ class Course(models.Model):
     def total_reviews(self):
         return self.review_set.count()
     
+    @staticmethod
+    def bayesian_rating(total, review_count):
+        """Overall rating shrunk towards RANK_PRIOR_MEAN by RANK_PRIOR_WEIGHT virtual reviews"""
+        return (RANK_PRIOR_WEIGHT * RANK_PRIOR_MEAN + total) / (RANK_PRIOR_WEIGHT + review_count)
+
+    def compute_rank_score(self, overall_rating_sum=None, review_count=None):
+        """Score used for the default ordering, higher ranks first"""
+        if overall_rating_sum is None:
+            overall_rating_sum = self.overall_rating_sum
+        if review_count is None:
+            review_count = self.review_count
+        return (
+            RANK_LEVEL_BONUS.get(self.level, 0.0)
+            + (RANK_SESSIONS_BONUS if self.has_sessions else 0.0)
+            + self.bayesian_rating(overall_rating_sum, review_count)
+        )
+
+    @classmethod
+    def rank_score_expression(cls, overall_rating_sum, review_count):
+        """SQL equivalent of compute_rank_score() for use in UPDATE statements"""
+        return (
+            Case(
+                *(When(level=level, then=Value(bonus)) for level, bonus in RANK_LEVEL_BONUS.items()),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+            + Case(
+                When(has_sessions=True, then=Value(RANK_SESSIONS_BONUS)),
+                default=Value(0.0),
+                output_field=FloatField(),
+            )
+            + (Value(RANK_PRIOR_WEIGHT * RANK_PRIOR_MEAN) + Cast(overall_rating_sum, FloatField()))
+            / (Value(float(RANK_PRIOR_WEIGHT)) + review_count)
+        )
+
+    def derive_ratings(self, review_count, sums):
+        """Return the cached rating columns for a review count and per-field score sums"""
+        values = {'review_count': review_count}
+        for field in RATING_FIELDS:
+            total = sums.get(field) or 0
+            values[f'{field}_sum'] = total
+            # Round half up like SQL ROUND() so rows written by apply_rating_delta() compare equal
+            values[field] = float(
+                (Decimal(total) / review_count).quantize(Decimal('0.1'), rounding=ROUND_HALF_UP)
+            ) if review_count else 0.0
+        values['rank_score'] = self.compute_rank_score(values['overall_rating_sum'], review_count)
+        return values
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Remember stored values so save() only rewrites session rows / search entries when they change
+        instance._stored_values = {field: instance.__dict__.get(field) for field in TRACKED_FIELDS}
+        return instance
+
+    def _changed_fields(self, update_fields):
+        stored = getattr(self, '_stored_values', {})
+        return {
+            field for field in TRACKED_FIELDS
+            if (update_fields is None or field in update_fields)
+            and getattr(self, field) != stored.get(field)
+        }
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or set(update_fields) & set(RANK_INPUT_FIELDS):
+            self.rank_score = self.compute_rank_score()
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, 'rank_score'}
+
+        if update_fields is None or set(update_fields) & set(IMPORTED_FIELDS):
+            # The row may no longer match the handbook, so the next import rewrites it
+            self.content_hash = ''
+            if update_fields is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'content_hash'}
+
+        changed = self._changed_fields(update_fields)
+
+        bump = not self._state.adding and self.pk is not None
+        if bump:
+            # Incremented in SQL so it can't collide with a concurrent apply_rating_delta()
+            self.version = F('version') + 1
+            if update_fields is not None:
+                kwargs['update_fields'] = {*kwargs['update_fields'], 'version', 'updated_at'}
+
+        with transaction.atomic(savepoint=False):
+            super().save(*args, **kwargs)
+            if bump:
+                self.version = type(self).objects.using(self._state.db).values_list(
+                    'version', flat=True
+                ).get(pk=self.pk)
+            if 'sessions' in changed:
+                CourseSession.sync(self)
+            if changed & set(SEARCH_FIELDS):
+                index_courses([self], using=self._state.db)
+            bump_catalogue_generation()
+            if bump:
+                invalidate_courses([self.pk])
+
+        self._stored_values = {field: getattr(self, field) for field in TRACKED_FIELDS}
+
+    def delete(self, *args, **kwargs):
+        pk = self.pk
+        with transaction.atomic(using=self._state.db, savepoint=False):
+            result = super().delete(*args, **kwargs)
+            unindex_courses([pk], using=self._state.db)
+            bump_catalogue_generation()
+            invalidate_courses([pk])
+        return result
+
     def update_ratings(self):
-        """Update cached rating averages and review count"""
-        from django.db.models import Avg
-        
-        reviews = self.review_set.all()
-        review_count = reviews.count()
-        
-        if reviews.exists():
-            averages = reviews.aggregate(
-                avg_enjoyment=Avg('enjoyment'),
-                avg_usefullness=Avg('usefullness'),
-                avg_manageability=Avg('manageability'),
-                avg_overall=Avg('overall_rating')
+        """Rebuild cached rating sums, averages and review count from scratch.
+
+        Review writes keep these columns up to date incrementally through
+        apply_rating_delta(), so this is only needed to repair drift.
+        """
+        totals = self.review_set.aggregate(
+            count=Count('id'),
+            **{field: Sum(field) for field in RATING_FIELDS}
+        )
+        values = self.derive_ratings(totals.pop('count'), totals)
+
+        for field, value in values.items():
+            setattr(self, field, value)
+
+        self.save(update_fields=list(values))
+
+        CourseRatingHistogram.objects.update_or_create(
+            course=self, defaults=self.review_set.aggregate(**CourseRatingHistogram.count_aggregates())
+        )
+        # A lookup between save() and here may have cached the row with the old histogram
+        invalidate_courses([self.pk])
+
+    @property
+    def rating_distribution(self):
+        """Star counts per rating dimension, ready for the detail page bars"""
+        try:
+            histogram = self.histogram
+        except CourseRatingHistogram.DoesNotExist:
+            histogram = CourseRatingHistogram(course=self)
+
+        distribution = histogram.distribution()
+        for dimension in distribution:
+            dimension['average'] = getattr(self, dimension['field'])
+        return distribution
+
+    @classmethod
+    def apply_rating_delta(cls, course_id, count, **changes):
+        """Atomically shift a course's review count, rating sums and histogram.
+
+        ``count`` is +1/-1 when a review is added/removed (0 for an edit) and ``changes``
+        maps rating field names to the change in that field's sum, plus histogram columns
+        (see rating_changes()). The course row is updated in a single UPDATE built from F()
+        expressions that also re-derives the averages and rank_score, so concurrent writers
+        never lose updates and the cost is independent of how many reviews the course has.
+        """
+        new_count = F('review_count') + count
+        updates = {'review_count': new_count}
+
+        for field in RATING_FIELDS:
+            new_sum = F(f'{field}_sum') + changes.get(field, 0)
+            updates[f'{field}_sum'] = new_sum
+            updates[field] = Coalesce(
+                Round(Cast(new_sum, FloatField()) / NullIf(new_count, 0), 1),
+                Value(0.0),
+                output_field=FloatField(),
             )
-            
-            self.enjoyment = round(averages['avg_enjoyment'] or 0, 1)
-            self.usefullness = round(averages['avg_usefullness'] or 0, 1)
-            self.manageability = round(averages['avg_manageability'] or 0, 1)
-            self.overall_rating = round(averages['avg_overall'] or 0, 1)
-        else:
-            self.enjoyment = 0.0
-            self.usefullness = 0.0
-            self.manageability = 0.0
-            self.overall_rating = 0.0
-        
-        self.review_count = review_count  # Update the cached count
-        
-        self.save(update_fields=[
-            'enjoyment', 'usefullness', 'manageability', 
-            'overall_rating', 'review_count'
-        ])
+        updates['rank_score'] = cls.rank_score_expression(updates['overall_rating_sum'], new_count)
+        updates['version'] = F('version') + 1
+        updates['updated_at'] = Now()
+
+        cls.objects.filter(pk=course_id).update(**updates)
+        bump_catalogue_generation()
+
+        CourseRatingHistogram.apply_delta(course_id, {
+            column: change for column, change in changes.items()
+            if column not in RATING_FIELDS and change
+        })
+        invalidate_courses([course_id])
+
+    @classmethod
+    def bulk_upsert(cls, courses, using='default'):
+        """Insert or update unsaved courses by code, in one transaction.
+
+        The bulk counterpart of update_or_create() for imports: one INSERT ... ON CONFLICT
+        writes the IMPORTED_FIELDS of the whole batch, then one UPDATE bumps version and
+        re-derives rank_score for the rows that already existed, leaving their ratings
+        alone. Session rows, search entries and caches are refreshed as save() would.
+        Courses whose content_hash matches the stored one are not written at all.
+        Returns the (created, updated, unchanged) counts.
+        """
+        # A code repeated within the batch keeps its last record, as repeated update_or_create() calls would
+        courses = list({course.code: course for course in courses}.values())
+        if not courses:
+            return 0, 0, 0
+
+        manager = cls.objects.db_manager(using)
+        with transaction.atomic(using=using):
+            stored = {
+                row['code']: row
+                for row in manager.filter(
+                    code__in=[course.code for course in courses]
+                ).values('pk', 'content_hash', *TRACKED_FIELDS)
+            }
+            unchanged = {
+                course.code for course in courses
+                if course.content_hash and course.content_hash == stored.get(course.code, {}).get('content_hash')
+            }
+            if unchanged:
+                courses = [course for course in courses if course.code not in unchanged]
+                stored = {code: row for code, row in stored.items() if code not in unchanged}
+            if not courses:
+                return 0, 0, len(unchanged)
+
+            codes = [course.code for course in courses]
+            for course in courses:
+                course.rank_score = course.compute_rank_score()
+
+            manager.bulk_create(
+                courses, update_conflicts=True, unique_fields=['code'], update_fields=[*IMPORTED_FIELDS, 'content_hash'],
+            )
+            ids = dict(manager.filter(code__in=codes).values_list('code', 'pk'))
+            for course in courses:
+                course.pk = ids[course.code]
+
+            updated_ids = [row['pk'] for row in stored.values()]
+            if updated_ids:
+                manager.filter(pk__in=updated_ids).update(
+                    version=F('version') + 1,
+                    updated_at=Now(),
+                    rank_score=cls.rank_score_expression(F('overall_rating_sum'), F('review_count')),
+                )
+
+            def changed(course, fields):
+                row = stored.get(course.code)
+                return row is None or any(getattr(course, field) != row[field] for field in fields)
+
+            CourseSession.sync_many([course for course in courses if changed(course, ['sessions'])], using=using)
+            searchable = [course for course in courses if changed(course, SEARCH_FIELDS)]
+            if searchable:
+                index_courses(searchable, using=using)
+            bump_catalogue_generation()
+            invalidate_courses(updated_ids)
+
+        return len(courses) - len(stored), len(stored), len(unchanged)
 
     class Meta:
-        ordering = [
-            Case(
-                When(level='UG', then=1),
-                When(level='PG', then=2),
-                output_field=IntegerField(),
-            ),
-            '-has_sessions', 
-            '-overall_rating', 
-            '-review_count'
-            ]
+        # Served by course_rank_idx, rank_score already encodes level and session precedence
+        ordering = ['-rank_score', 'code']
+        indexes = [
+            models.Index(fields=['-rank_score', 'code'], name='course_rank_idx'),
+        ]
 
-    
 
+class ReviewQuerySet(models.QuerySet):
+
+    # Everything review.html renders, plus review_date for the feed's keyset cursor
+    FEED_FIELDS = (
+        'id', 'course_id', 'author_id', *RATING_FIELDS, 'review_date',
+        'course_completion', 'completion_year', 'completion_term_ordinal',
+        'title', 'text_review', 'grade', 'is_anonymous',
+        'author__username', 'course__code', 'course__name',
+    )
 
+    def feed(self):
+        """Reviews ready for the review feed: author and course joined in, only the rendered columns loaded"""
+        return self.select_related('author', 'course').only(*self.FEED_FIELDS)
 
 
 class Review(models.Model):
@@ -91,24 +429,287 @@ class Review(models.Model):
     manageability = models.IntegerField(validators=[MinValueValidator(1), MaxValueValidator(5)])
     review_date = models.DateTimeField(auto_now_add=True)
     course_completion = models.CharField(max_length=20, help_text="Format: YYYY-Season (e.g., 2025-Autumn)")
+    # course_completion split into sortable parts, kept in sync by save()
+    completion_year = models.PositiveSmallIntegerField(default=0)
+    completion_term_ordinal = models.PositiveSmallIntegerField(default=0)
 
     title = models.CharField(max_length=100, blank=True, null=True)
     text_review = models.TextField(blank=True, null=True)     
     grade = models.IntegerField(blank=True, null=True)
     is_anonymous = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    objects = ReviewQuerySet.as_manager()
     
     def __str__(self):
         return f"Review of {self.course.code} by {self.author.username}"
     
+    def rating_scores(self):
+        """Map each rating field to this review's score"""
+        return {field: getattr(self, field) for field in RATING_FIELDS}
+
+    @staticmethod
+    def parse_completion(course_completion):
+        """(year, term ordinal) for a "YYYY-Session" string, 0 for any part that can't be read"""
+        year, _, session = (course_completion or '').partition('-')
+        year = int(year) if year.strip().isdigit() and len(year.strip()) <= 4 else 0
+        return year, COMPLETION_TERMS.get(session.strip().upper(), 0)
+
+    def set_completion(self, year, session):
+        """Record when the course was taken, as the display string and its sortable parts"""
+        self.course_completion = f"{year}-{session}"
+        self.completion_year, self.completion_term_ordinal = self.parse_completion(self.course_completion)
+
     def save(self, *args, **kwargs):
-        super().save(*args, **kwargs)
-        self.course.update_ratings()  
-    
-    def delete(self, *args, **kwargs):
-        course = self.course
-        super().delete(*args, **kwargs)
-        course.update_ratings()  
-    
+        # Keep the sortable columns in step with course_completion, however it was set
+        self.completion_year, self.completion_term_ordinal = self.parse_completion(self.course_completion)
+        update_fields = kwargs.get('update_fields')
+        if update_fields is not None:
+            kwargs['update_fields'] = {*update_fields, 'updated_at'}
+            if 'course_completion' in update_fields:
+                kwargs['update_fields'] |= {'completion_year', 'completion_term_ordinal'}
+
+        with transaction.atomic(savepoint=False):
+            previous = None
+            if not self._state.adding and self.pk:
+                # Lock the stored row so the delta is taken against what is actually committed
+                previous = (
+                    Review.objects.select_for_update()
+                    .filter(pk=self.pk)
+                    .values('course_id', *RATING_FIELDS)
+                    .first()
+                )
+
+            super().save(*args, **kwargs)
+
+            added = rating_changes(self.rating_scores())
+            if previous is None:
+                record_rating_delta(self.course_id, 1, **added)
+            elif previous['course_id'] != self.course_id:
+                record_rating_delta(previous['course_id'], -1, **rating_changes(previous, sign=-1))
+                record_rating_delta(self.course_id, 1, **added)
+            else:
+                changes = added
+                for column, change in rating_changes(previous, sign=-1).items():
+                    changes[column] = changes.get(column, 0) + change
+                if any(changes.values()):
+                    record_rating_delta(self.course_id, 0, **changes)
+
+    # Deletes (including cascades from Course/User) are handled by the post_delete
+    # receiver in a_users/signals.py, which removes the review from the running sums.
+
     class Meta:
         unique_together = ['course', 'author']
+        # One per ReviewFilter sort option, ending in the keyset tiebreak, so each feed page
+        # is an index range scan (the rating and completion ones are also read backwards)
+        indexes = [
+            models.Index(fields=['course', '-review_date', '-id'], name='review_course_date_idx'),
+            models.Index(fields=['course', '-overall_rating', '-id'], name='review_course_rating_idx'),
+            models.Index(fields=['course', 'completion_year', 'completion_term_ordinal', 'id'],
+                         name='review_course_term_idx'),
+            # Latest review change per course, for the detail page's conditional GET validators
+            models.Index(fields=['course', 'updated_at'], name='review_course_updated_idx'),
+        ]
+
+
+class CourseRatingHistogram(models.Model):
+    """Per-course count of 1-5 star scores for each rating dimension.
+
+    Kept up to date by Course.apply_rating_delta() so the detail page can show
+    distributions without aggregating reviews. Columns are named <field>_<stars>.
+    """
+    course = models.OneToOneField(Course, on_delete=models.CASCADE, primary_key=True, related_name='histogram')
+
+    overall_rating_1 = models.PositiveIntegerField(default=0)
+    overall_rating_2 = models.PositiveIntegerField(default=0)
+    overall_rating_3 = models.PositiveIntegerField(default=0)
+    overall_rating_4 = models.PositiveIntegerField(default=0)
+    overall_rating_5 = models.PositiveIntegerField(default=0)
+
+    enjoyment_1 = models.PositiveIntegerField(default=0)
+    enjoyment_2 = models.PositiveIntegerField(default=0)
+    enjoyment_3 = models.PositiveIntegerField(default=0)
+    enjoyment_4 = models.PositiveIntegerField(default=0)
+    enjoyment_5 = models.PositiveIntegerField(default=0)
+
+    usefullness_1 = models.PositiveIntegerField(default=0)
+    usefullness_2 = models.PositiveIntegerField(default=0)
+    usefullness_3 = models.PositiveIntegerField(default=0)
+    usefullness_4 = models.PositiveIntegerField(default=0)
+    usefullness_5 = models.PositiveIntegerField(default=0)
+
+    manageability_1 = models.PositiveIntegerField(default=0)
+    manageability_2 = models.PositiveIntegerField(default=0)
+    manageability_3 = models.PositiveIntegerField(default=0)
+    manageability_4 = models.PositiveIntegerField(default=0)
+    manageability_5 = models.PositiveIntegerField(default=0)
+
+    LABELS = {
+        'overall_rating': 'Overall',
+        'enjoyment': 'Enjoyment',
+        'usefullness': 'Usefulness',
+        'manageability': 'Manageability',
+    }
+
+    def __str__(self):
+        return f"Rating histogram for {self.course_id}"
+
+    @staticmethod
+    def columns():
+        return [f'{field}_{stars}' for field in RATING_FIELDS for stars in STAR_VALUES]
 
+    @classmethod
+    def count_aggregates(cls):
+        """Conditional Count() per column, for rebuilding histograms from reviews"""
+        return {
+            f'{field}_{stars}': Count('id', filter=models.Q(**{field: stars}))
+            for field in RATING_FIELDS for stars in STAR_VALUES
+        }
+
+    @classmethod
+    def apply_delta(cls, course_id, changes):
+        """Shift histogram columns with F() deltas, creating the row on first use"""
+        if not changes:
+            return
+
+        updated = cls.objects.filter(course_id=course_id).update(
+            **{column: F(column) + change for column, change in changes.items()}
+        )
+        # Only adding a review creates a missing row; removals come from cascades that delete it anyway
+        if updated or not any(change > 0 for change in changes.values()):
+            return
+
+        try:
+            with transaction.atomic():
+                cls.objects.create(
+                    course_id=course_id,
+                    **{column: max(change, 0) for column, change in changes.items()}
+                )
+        except IntegrityError:
+            # Another writer created the row first, apply on top of theirs
+            cls.objects.filter(course_id=course_id).update(
+                **{column: F(column) + change for column, change in changes.items()}
+            )
+
+    def distribution(self):
+        """List of {'field', 'label', 'total', 'bars'} with bars ordered 5 stars down to 1"""
+        dimensions = []
+        for field in RATING_FIELDS:
+            counts = {stars: getattr(self, f'{field}_{stars}') for stars in STAR_VALUES}
+            total = sum(counts.values())
+            dimensions.append({
+                'field': field,
+                'label': self.LABELS[field],
+                'total': total,
+                'bars': [
+                    {
+                        'stars': stars,
+                        'count': counts[stars],
+                        'percent': round(counts[stars] * 100 / total) if total else 0,
+                    }
+                    for stars in reversed(STAR_VALUES)
+                ],
+            })
+        return dimensions
+
+
+class CourseSession(models.Model):
+    """One row per session a course is offered in, mirroring Course.sessions.
+
+    The JSON list can't be indexed portably, so session filtering looks courses
+    up through this table instead. Course.save() keeps it in sync.
+    """
+    course = models.ForeignKey(Course, on_delete=models.CASCADE, related_name='session_rows')
+    name = models.CharField(max_length=100)
+
+    def __str__(self):
+        return f"{self.course_id} - {self.name}"
+
+    @staticmethod
+    def session_names(sessions):
+        return {str(session).strip()[:100] for session in sessions or [] if session and str(session).strip()}
+
+    @classmethod
+    def sync(cls, course):
+        """Make the rows for one course match its sessions list"""
+        cls.sync_many([course], using=course._state.db or 'default')
+
+    @classmethod
+    def sync_many(cls, courses, using='default'):
+        """Make the rows for several saved courses match their sessions lists, in at most three queries"""
+        if not courses:
+            return
+        wanted = {(course.pk, name) for course in courses for name in cls.session_names(course.sessions)}
+        existing = {
+            (course_id, name): pk
+            for pk, course_id, name in cls.objects.using(using).filter(
+                course_id__in=[course.pk for course in courses]
+            ).values_list('pk', 'course_id', 'name')
+        }
+
+        stale = [pk for key, pk in existing.items() if key not in wanted]
+        if stale:
+            cls.objects.using(using).filter(pk__in=stale).delete()
+        missing = wanted - existing.keys()
+        if missing:
+            cls.objects.using(using).bulk_create([cls(course_id=course_id, name=name) for course_id, name in missing])
+
+    class Meta:
+        unique_together = ['course', 'name']
+        indexes = [
+            models.Index(fields=['name', 'course'], name='course_session_name_idx'),
+        ]
+
+
+class ImportCheckpoint(models.Model):
+    """Progress of import_courses through one handbook file, for --resume.
+
+    Keyed by the file's path, size and modification time plus the level it is
+    imported as, so an edited file starts over. ``records`` counts the records
+    already committed; it is advanced in the same transaction as each batch.
+    """
+    path = models.CharField(max_length=500)
+    size = models.BigIntegerField()
+    mtime_ns = models.BigIntegerField()
+    level = models.CharField(max_length=2, choices=Course.LEVEL_CHOICES)
+    records = models.PositiveIntegerField(default=0)
+    completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    def __str__(self):
+        return f"{self.path} ({self.records} records{', completed' if self.completed else ''})"
+
+    @classmethod
+    def start(cls, path, level, resume=False):
+        """Checkpoint for importing ``path`` now, reset to the beginning unless resuming"""
+        path = Path(path).resolve()
+        stat = path.stat()
+        checkpoint, created = cls.objects.get_or_create(
+            path=str(path), size=stat.st_size, mtime_ns=stat.st_mtime_ns, level=level,
+        )
+        # Entries for earlier versions of the file can never match again
+        cls.objects.filter(path=str(path)).exclude(pk=checkpoint.pk).delete()
+        if not resume and not created:
+            checkpoint.records = 0
+            checkpoint.completed = False
+            checkpoint.save(update_fields=['records', 'completed', 'updated_at'])
+        return checkpoint
+
+    def advance(self, records, completed=False):
+        """Record that the first ``records`` records are committed, call inside the batch's transaction"""
+        self.records = records
+        self.completed = completed
+        self.save(update_fields=['records', 'completed', 'updated_at'])
+
+    class Meta:
+        unique_together = ['path', 'size', 'mtime_ns', 'level']
+
+
+class CatalogueGeneration(models.Model):
+    """The single row holding the catalogue generation, see a_reviews.caching"""
+    ROW = 1
+
+    value = models.BigIntegerField(default=0)
+
+    def __str__(self):
+        return f"Catalogue generation {self.value}"
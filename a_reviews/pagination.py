@@ -0,0 +1,183 @@
+"""Keyset (cursor) pagination for the infinite scroll feeds.
+
+Instead of COUNT(*) plus OFFSET, each page remembers the sort key of its last
+row and the next page asks for rows strictly after it, so page N costs the same
+as page 1 and rows don't shift between pages when ratings change mid-scroll.
+The cursor is the queryset's ordering and that sort key, JSON encoded into a
+URL safe token.
+"""
+import base64
+import datetime
+import json
+
+from django.core.cache import cache
+from django.core.exceptions import FieldDoesNotExist
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Q
+
+
+class CursorJSONEncoder(DjangoJSONEncoder):
+    """DjangoJSONEncoder without its millisecond rounding, a cursor must land exactly on its row"""
+
+    def default(self, o):
+        if isinstance(o, (datetime.datetime, datetime.time)):
+            return o.isoformat()
+        return super().default(o)
+
+
+def encode_cursor(ordering, values):
+    payload = json.dumps({'o': ordering, 'v': values}, cls=CursorJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """Return (ordering, values) from a cursor token, or None if it is malformed"""
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)))
+        return payload['o'], payload['v']
+    except (ValueError, TypeError, KeyError):
+        return None
+
+
+class KeysetPage:
+    def __init__(self, object_list, has_next, next_cursor):
+        self.object_list = object_list
+        self.has_next = has_next
+        self.next_cursor = next_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class KeysetPaginator:
+    """Paginate a queryset by its ordering, with ``tiebreak`` appended unless the ordering is already unique.
+
+    The tiebreak runs in the same direction as the last ordering field, so an index
+    such as (course, -overall_rating, -id) serves the whole ordering. Every ordering
+    field must be a non-null column or annotation on the model.
+    """
+
+    def __init__(self, queryset, per_page, tiebreak='pk'):
+        ordering = list(queryset.query.order_by or queryset.model._meta.ordering)
+        if not any(self._is_unique(queryset.model, field.lstrip('-')) for field in ordering):
+            descending = bool(ordering) and ordering[-1].startswith('-')
+            ordering.append(f'-{tiebreak}' if descending else tiebreak)
+        self.ordering = ordering
+        self.queryset = queryset.order_by(*ordering)
+        self.per_page = per_page
+
+    @staticmethod
+    def _is_unique(model, name):
+        if name == 'pk':
+            return True
+        try:
+            return model._meta.get_field(name).unique
+        except FieldDoesNotExist:
+            return False
+
+    def after(self, values):
+        """Q for rows that sort strictly after the row with these ordering values"""
+        condition = Q()
+        equal = Q()
+        for field, value in zip(self.ordering, values):
+            name = field.lstrip('-')
+            lookup = 'lt' if field.startswith('-') else 'gt'
+            condition |= equal & Q(**{f'{name}__{lookup}': value})
+            equal &= Q(**{name: value})
+
+        # Redundant bound on the leading column, so the planner seeks straight to the
+        # cursor in an index on the ordering instead of scanning from the first row
+        leading = self.ordering[0]
+        bound = 'lte' if leading.startswith('-') else 'gte'
+        return Q(**{f'{leading.lstrip("-")}__{bound}': values[0]}) & condition
+
+    def cursor_values(self, cursor):
+        """Ordering values carried by ``cursor``, or None if it is missing, malformed or for another ordering"""
+        decoded = decode_cursor(cursor) if cursor else None
+        if decoded and decoded[0] == self.ordering and len(decoded[1]) == len(self.ordering):
+            return decoded[1]
+        return None
+
+    def page(self, cursor=None):
+        """The page after ``cursor``, or the first page for a missing, malformed or stale cursor"""
+        queryset = self.queryset
+        values = self.cursor_values(cursor)
+        if values is not None:
+            queryset = queryset.filter(self.after(values))
+
+        # One extra row tells us whether there is a next page without a COUNT
+        rows = list(queryset[:self.per_page + 1])
+        has_next = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        next_cursor = None
+        if has_next:
+            last = rows[-1]
+            next_cursor = encode_cursor(self.ordering, [
+                getattr(last, field.lstrip('-')) for field in self.ordering
+            ])
+        return KeysetPage(rows, has_next, next_cursor)
+
+
+class CachedKeysetPaginator(KeysetPaginator):
+    """KeysetPaginator that serves pages from a cached, ordered list of sort keys.
+
+    The first ``max_rows`` of the queryset's (pk, *ordering values) rows are computed
+    once and cached under ``cache_key``, with each row's position keyed by its values,
+    after which a page is a slice of that list plus one pk__in fetch. Cursors are the
+    same as KeysetPaginator's, so a cursor whose row is no longer in the cached list,
+    or a page running past its end, just falls back to a keyset query.
+    """
+
+    def __init__(self, queryset, per_page, cache_key, timeout=None, tiebreak='pk', max_rows=None):
+        super().__init__(queryset, per_page, tiebreak)
+        self.cache_key = cache_key
+        self.timeout = timeout
+        self.max_rows = max_rows
+
+    def sort_keys(self):
+        """(keys, positions, complete): the cached rows, their indexes by ordering values,
+        and whether they are the whole result set"""
+        cached = cache.get(self.cache_key)
+        if cached is None:
+            rows = self.queryset.values_list('pk', *(field.lstrip('-') for field in self.ordering))
+            if self.max_rows is not None:
+                # One extra row tells us whether the list was cut short
+                rows = rows[:self.max_rows + 1]
+            # Stored as they would come back from a cursor, so the two compare equal
+            keys = json.loads(json.dumps(list(rows), cls=CursorJSONEncoder))
+            complete = self.max_rows is None or len(keys) <= self.max_rows
+            keys = keys[:self.max_rows]
+            positions = {tuple(key[1:]): index for index, key in enumerate(keys)}
+            cached = (keys, positions, complete)
+            cache.set(self.cache_key, cached, self.timeout)
+        return cached
+
+    def page(self, cursor=None):
+        keys, positions, complete = self.sort_keys()
+
+        start = 0
+        values = self.cursor_values(cursor)
+        if values is not None:
+            index = positions.get(tuple(values))
+            if index is None:
+                return super().page(cursor)
+            start = index + 1
+
+        end = start + self.per_page
+        if not complete and end > len(keys):
+            return super().page(cursor)
+
+        window = keys[start:end]
+        objects = self.queryset.order_by().in_bulk([key[0] for key in window])
+        rows = [objects[key[0]] for key in window if key[0] in objects]
+
+        has_next = end < len(keys) or not complete
+        next_cursor = encode_cursor(self.ordering, window[-1][1:]) if has_next else None
+        return KeysetPage(rows, has_next, next_cursor)
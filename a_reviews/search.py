@@ -0,0 +1,283 @@
+"""Full-text course search.
+
+Postgres keeps a weighted ``search_vector`` tsvector column (code A, name B,
+description C) as a generated column with a GIN index, so it is always in sync
+with the row. SQLite (development and tests) uses an FTS5 table that
+Course.save() refreshes through index_courses() and course deletes clear through
+unindex_courses(). Both are created by migration
+0017_course_search. Other backends fall back to icontains.
+
+autocomplete() serves typeahead from an in-process sorted index of code and name
+word prefixes, rebuilt whenever the catalogue generation moves on.
+
+fuzzy_search_courses() handles typos ("machne lerning") with trigram matching
+over code and name: pg_trgm's word similarity and GIN trigram indexes on
+Postgres (migration 0018_course_trigram_search), an in-process trigram index
+elsewhere.
+"""
+import heapq
+import re
+from collections import Counter, defaultdict
+
+from django.db import connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+from sortedcontainers import SortedList
+
+from a_reviews.caching import catalogue_generation
+
+FTS_TABLE = 'a_reviews_course_fts'
+
+# Column weights for SQLite's bm25(), matching the tsvector A/B/C weights
+FTS_WEIGHTS = (10.0, 5.0, 1.0)
+
+# Share of the query's trigrams a course must contain to count as a fuzzy match,
+# and how many of the best fuzzy matches are returned
+FUZZY_THRESHOLD = 0.5
+FUZZY_LIMIT = 50
+
+# Number of typeahead suggestions returned by autocomplete()
+AUTOCOMPLETE_LIMIT = 8
+
+# Prefixes up to this length get a precomputed, rank ordered course list, used when every
+# typed word matches more than PREFIX_SCAN_LIMIT tokens (narrower words read the token list).
+PREFIX_BUCKET_LENGTH = 3
+PREFIX_SCAN_LIMIT = 256
+
+_trigram_index = None
+_prefix_index = None
+
+
+def search_terms(query):
+    """Split user input into plain word tokens, dropping any query syntax"""
+    return re.findall(r'\w+', query or '')
+
+
+def search_courses(queryset, query):
+    """Filter a Course queryset to matches for ``query`` and order it by relevance"""
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+
+    if vendor == 'postgresql':
+        # Prefix match every term, so partial words and codes ("COMP") still hit
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        return queryset.filter(
+            RawSQL(f'"{table}"."search_vector" @@ to_tsquery(\'english\', %s)', [tsquery],
+                   output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(f'ts_rank("{table}"."search_vector", to_tsquery(\'english\', %s))', [tsquery],
+                               output_field=FloatField())
+        ).order_by('-search_rank', *queryset.query.order_by or queryset.model._meta.ordering)
+
+    if vendor == 'sqlite':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+        # A real join so MATCH runs once; bm25() is lower for better matches. The rank is
+        # an annotation rather than an extra select so keyset pagination can filter on it.
+        return queryset.extra(
+            tables=[FTS_TABLE],
+            where=[f'{FTS_TABLE}.rowid = "{table}"."id"', f'{FTS_TABLE} MATCH %s'],
+            params=[match],
+        ).annotate(
+            search_rank=RawSQL(f'-bm25({FTS_TABLE}, {weights})', [], output_field=FloatField())
+        ).order_by('-search_rank', *queryset.query.order_by or queryset.model._meta.ordering)
+
+    condition = Q()
+    for term in terms:
+        condition &= Q(code__icontains=term) | Q(name__icontains=term) | Q(description__icontains=term)
+    return queryset.filter(condition)
+
+
+def trigrams(text):
+    """pg_trgm style trigrams: lowercased words padded with two leading spaces and one trailing"""
+    grams = set()
+    for word in re.findall(r'\w+', (text or '').lower()):
+        padded = f'  {word} '
+        grams.update(padded[i:i + 3] for i in range(len(padded) - 2))
+    return grams
+
+
+class TrigramIndex:
+    """Inverted index from trigram to course ids over code and name"""
+
+    def __init__(self, rows, signature=None):
+        self.signature = signature
+        postings = defaultdict(list)
+        for course_id, code, name in rows:
+            for gram in trigrams(f'{code} {name}'):
+                postings[gram].append(course_id)
+        self.postings = dict(postings)
+
+    def lookup(self, query, threshold=FUZZY_THRESHOLD, limit=FUZZY_LIMIT):
+        """Best (similarity, course_id) pairs, similarity being the share of query trigrams matched"""
+        grams = trigrams(query)
+        if not grams:
+            return []
+
+        counts = Counter()
+        for gram in grams:
+            counts.update(self.postings.get(gram, ()))
+
+        needed = threshold * len(grams)
+        return heapq.nlargest(limit, (
+            (count / len(grams), course_id)
+            for course_id, count in counts.items() if count >= needed
+        ))
+
+
+def get_trigram_index(queryset):
+    """In-process trigram index for the catalogue, rebuilt whenever the catalogue changes.
+
+    Deleted courses can linger in the index, which is harmless because matches
+    are always re-filtered against the course table.
+    """
+    global _trigram_index
+
+    signature = (queryset.db, catalogue_generation())
+    if _trigram_index is None or _trigram_index.signature != signature:
+        rows = queryset.model._default_manager.using(queryset.db).order_by().values_list('id', 'code', 'name')
+        _trigram_index = TrigramIndex(rows.iterator(), signature)
+    return _trigram_index
+
+
+class PrefixIndex:
+    """Typeahead index over lowercased course codes and name words.
+
+    Courses are numbered by rank (best overall_rating first) and their tokens kept
+    in a SortedList of (token, rank) pairs, so a narrow word is a short range read.
+    Every 1-3 character prefix also keeps its courses in rank order, so a broad
+    query reads just the first few entries of one bucket.
+    """
+
+    def __init__(self, rows, signature=None):
+        self.signature = signature
+        self.courses = []
+        self.tokens = []
+        buckets = defaultdict(list)
+        entries = []
+        for rank, (course_id, code, name, overall_rating) in enumerate(
+            sorted(rows, key=lambda row: (-row[3], row[1]))
+        ):
+            tokens = {code.lower(), *(term.lower() for term in search_terms(name))}
+            self.courses.append({'code': code, 'name': name, 'overall_rating': overall_rating})
+            self.tokens.append(tuple(tokens))
+            for prefix in {token[:length] for token in tokens for length in range(1, PREFIX_BUCKET_LENGTH + 1)}:
+                buckets[prefix].append(rank)
+            entries.extend((token, rank) for token in tokens)
+        self.buckets = dict(buckets)
+        self.entries = SortedList(entries)
+
+    def _token_range(self, prefix):
+        return (prefix,), (prefix + '\uffff',)
+
+    def count(self, prefix):
+        """Number of tokens starting with ``prefix``"""
+        low, high = self._token_range(prefix)
+        return self.entries.bisect_left(high) - self.entries.bisect_left(low)
+
+    def lookup(self, query, limit=AUTOCOMPLETE_LIMIT):
+        """Courses matching every word of ``query`` as a prefix, best rated first"""
+        terms = {term.lower() for term in search_terms(query)}
+        if not terms:
+            return []
+
+        # Walk the candidates of the most selective word in rank order
+        counts = {term: self.count(term) for term in terms}
+        primary = min(terms, key=counts.get)
+        if counts[primary] <= PREFIX_SCAN_LIMIT:
+            ranks = sorted({rank for _, rank in self.entries.irange(*self._token_range(primary))})
+        else:
+            # Every word is common, so matches are dense and the walk stops early
+            ranks = self.buckets.get(primary[:PREFIX_BUCKET_LENGTH], ())
+
+        results = []
+        for rank in ranks:
+            tokens = self.tokens[rank]
+            if all(any(token.startswith(term) for token in tokens) for term in terms):
+                results.append(self.courses[rank])
+                if len(results) == limit:
+                    break
+        return results
+
+
+def get_prefix_index(queryset):
+    """In-process prefix index for the catalogue, built on first use and whenever the catalogue changes"""
+    global _prefix_index
+
+    signature = (queryset.db, catalogue_generation())
+    if _prefix_index is None or _prefix_index.signature != signature:
+        rows = queryset.model._default_manager.using(queryset.db).order_by().values_list(
+            'id', 'code', 'name', 'overall_rating'
+        )
+        _prefix_index = PrefixIndex(rows.iterator(), signature)
+    return _prefix_index
+
+
+def autocomplete(queryset, query, limit=AUTOCOMPLETE_LIMIT):
+    """Top ``limit`` courses by overall rating whose code or name words start with the typed words"""
+    return get_prefix_index(queryset).lookup(query, limit)
+
+
+def fuzzy_search_courses(queryset, query):
+    """Typo tolerant match on code and name, most similar first"""
+    terms = search_terms(query)
+    if not terms:
+        return queryset
+
+    text = ' '.join(terms)
+    vendor = connections[queryset.db].vendor
+    table = queryset.model._meta.db_table
+
+    if vendor == 'postgresql':
+        # <% is pg_trgm's word similarity operator, served by the gin_trgm_ops indexes
+        return queryset.filter(
+            RawSQL(f'(%s <%% "{table}"."name" OR %s <%% "{table}"."code")', [text, text],
+                   output_field=BooleanField())
+        ).annotate(
+            search_rank=RawSQL(
+                f'GREATEST(word_similarity(%s, "{table}"."name"), word_similarity(%s, "{table}"."code"))',
+                [text, text], output_field=FloatField()
+            )
+        ).order_by('-search_rank', *queryset.query.order_by or queryset.model._meta.ordering)
+
+    matches = get_trigram_index(queryset).lookup(text)
+    if not matches:
+        return queryset.none()
+
+    # One simple CASE string compiles far faster than a When() per match
+    cases = ' '.join('WHEN %s THEN %s' for _ in matches)
+    params = [value for score, course_id in matches for value in (course_id, score)]
+    return queryset.filter(id__in=[course_id for _, course_id in matches]).annotate(
+        search_rank=RawSQL(f'CASE "{table}"."id" {cases} ELSE 0 END', params, output_field=FloatField())
+    ).order_by('-search_rank', *queryset.query.order_by or queryset.model._meta.ordering)
+
+
+def index_courses(courses, using='default'):
+    """Refresh the SQLite FTS rows for the given courses (Postgres indexes itself)"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not courses:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(
+            f'DELETE FROM {FTS_TABLE} WHERE rowid = %s',
+            [(course.pk,) for course in courses]
+        )
+        cursor.executemany(
+            f'INSERT INTO {FTS_TABLE} (rowid, code, name, description) VALUES (%s, %s, %s, %s)',
+            [(course.pk, course.code, course.name, course.description) for course in courses]
+        )
+
+
+def unindex_courses(pks, using='default'):
+    """Drop the SQLite FTS rows of deleted courses, which would otherwise skew bm25() statistics"""
+    connection = connections[using]
+    if connection.vendor != 'sqlite' or not pks:
+        return
+
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {FTS_TABLE} WHERE rowid = %s', [(pk,) for pk in pks])
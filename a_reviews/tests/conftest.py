@@ -1,6 +1,8 @@
 # tests/conftest.py
 import pytest
+from django.core.cache import cache
 from playwright.sync_api import Playwright
+from a_reviews import search
 from a_reviews.factories import CourseFactory, ReviewFactory, UserFactory
 
 # Playwright fixtures 
@@ -18,6 +20,20 @@ def page(browser):
 
 # General fixtures
 
+@pytest.fixture(autouse=True)
+def disable_silk(settings):
+    """Keep silk's request profiling (and its extra EXPLAIN queries) out of query counts"""
+    settings.MIDDLEWARE = [m for m in settings.MIDDLEWARE if m != 'silk.middleware.SilkyMiddleware']
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    """Start every test with an empty cache and search indexes, since rolled back rows
+    can reuse primary keys and the catalogue generation"""
+    cache.clear()
+    search._trigram_index = search._prefix_index = None
+    yield
+    cache.clear()
+
 @pytest.fixture
 def courses():
     """Create a batch of courses"""
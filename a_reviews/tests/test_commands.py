@@ -0,0 +1,378 @@
+import json
+import pytest
+from io import StringIO
+from pathlib import Path
+from django.core.management import call_command
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from a_reviews.handbook import HANDBOOK_URL, read_records
+from a_reviews.models import Course, CourseRatingHistogram, ImportCheckpoint, Review
+from a_reviews.search import FTS_TABLE, search_courses
+
+
+@pytest.mark.django_db
+class TestRecomputeRatings:
+
+    def test_verify_reports_drift_without_writing(self, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        Course.objects.filter(pk=course.pk).update(review_count=7, overall_rating=1.0)
+
+        out = StringIO()
+        call_command('recompute_ratings', '--verify', stdout=out)
+
+        assert course.code in out.getvalue()
+        assert '1 courses have drifted' in out.getvalue()
+        course.refresh_from_db()
+        assert course.review_count == 7
+
+    def test_recompute_fixes_drift(self, course_with_two_reviews, courses):
+        course, reviews = course_with_two_reviews
+        Course.objects.update(review_count=3, overall_rating=2.5, overall_rating_sum=9)
+
+        call_command('recompute_ratings', stdout=StringIO())
+
+        course.refresh_from_db()
+        expected_sum = sum(review.overall_rating for review in reviews)
+        assert course.review_count == 2
+        assert course.overall_rating_sum == expected_sum
+        assert course.overall_rating == round(expected_sum / 2, 1)
+
+        for other in courses:
+            other.refresh_from_db()
+            assert other.review_count == 0
+            assert other.overall_rating == 0.0
+
+    def test_clean_data_is_reported_up_to_date(self, course_with_two_reviews):
+        out = StringIO()
+        call_command('recompute_ratings', '--verify', stdout=out)
+        assert 'up to date' in out.getvalue()
+
+    def test_rounding_matches_incremental_updates(self, course):
+        """Half-way averages written by review saves are not reported as drift"""
+        for i, rating in enumerate([4, 3, 3, 3]):
+            user = User.objects.create_user(username=f"rounding{i}", password="pass")
+            Review.objects.create(
+                course=course, author=user,
+                overall_rating=rating, enjoyment=rating, usefullness=rating, manageability=rating,
+                course_completion="2024-Autumn"
+            )
+
+        out = StringIO()
+        call_command('recompute_ratings', '--verify', stdout=out)
+
+        course.refresh_from_db()
+        assert course.overall_rating == 3.3
+        assert 'up to date' in out.getvalue()
+
+    def test_recompute_rebuilds_histograms(self, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        CourseRatingHistogram.objects.all().delete()
+
+        call_command('recompute_ratings', stdout=StringIO())
+
+        histogram = CourseRatingHistogram.objects.get(course=course)
+        assert sum(getattr(histogram, f'overall_rating_{stars}') for stars in range(1, 6)) == 2
+        for review in reviews:
+            assert getattr(histogram, f'enjoyment_{review.enjoyment}') >= 1
+
+
+@pytest.mark.django_db
+class TestImportCourses:
+
+    def handbook(self, tmp_path, records, name='handbook.json'):
+        path = tmp_path / name
+        path.write_text(json.dumps({'subjects': records}))
+        return str(path)
+
+    def record(self, code, title='Imported Course', sessions=('Autumn',), **extra):
+        return {
+            'code': code, 'title': title, 'description': f'About {code}',
+            'teachingPeriod': list(sessions), 'URL_MAP_FOR_CONTENT': f'/subjects/{code}',
+            'educationalAreaDisplay': 'Law', **extra,
+        }
+
+    def run_import(self, *args):
+        out = StringIO()
+        call_command('import_courses', *args, stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def test_reports_exact_created_and_changed_counts(self, tmp_path):
+        path = self.handbook(tmp_path, [self.record(f'7{i:04d}') for i in range(5)])
+        out = self.run_import('--file', path, '--batch-size', '2')
+        assert 'Total courses created: 5' in out
+        assert 'Total courses changed: 0' in out
+
+        records = [self.record(f'7{i:04d}', title='Renamed') for i in range(3, 8)]
+        out = self.run_import('--file', self.handbook(tmp_path, records), '--batch-size', '2')
+        assert 'Total courses created: 3' in out
+        assert 'Total courses changed: 2' in out
+        assert Course.objects.filter(name='Renamed').count() == 5
+
+    def test_update_keeps_ratings_and_refreshes_derived_data(self, tmp_path, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        course.refresh_from_db()
+        rank_score, version = course.rank_score, course.version
+        path = self.handbook(tmp_path, [
+            self.record(course.code, title='Quantum Gastronomy', sessions=['Spring'])
+        ])
+
+        self.run_import('--file', path, '--postgrad')
+
+        course.refresh_from_db()
+        assert course.name == 'Quantum Gastronomy'
+        assert course.review_count == 2
+        assert course.version == version + 1
+        assert course.rank_score != rank_score
+        assert course.rank_score == pytest.approx(course.compute_rank_score())
+        assert list(course.session_rows.values_list('name', flat=True)) == ['Spring']
+        assert Course.objects.filter(code=course.code).count() == 1
+        assert course in search_courses(Course.objects.all(), 'gastronomy')
+
+    @pytest.mark.parametrize('delete', [['--delete-all'], ['--delete-by', '--faculty', 'Law']])
+    def test_deleted_courses_leave_the_search_index(self, tmp_path, delete):
+        self.run_import('--file', self.handbook(tmp_path, [self.record(f'7{i:04d}') for i in range(3)]))
+        call_command('import_courses', *delete, stdout=StringIO())
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT COUNT(*) FROM {FTS_TABLE}')
+            assert cursor.fetchone()[0] == 0
+
+    def test_invalid_records_are_skipped(self, tmp_path):
+        path = self.handbook(tmp_path, [
+            self.record('80001'),
+            {'code': '80002'},
+            self.record('80003', title='x' * 200),
+        ])
+        out = self.run_import('--file', path)
+        assert 'Total courses created: 1' in out
+        assert list(Course.objects.values_list('code', flat=True)) == ['80001']
+
+    def test_non_text_values_are_stored_as_text(self, tmp_path):
+        path = self.handbook(tmp_path, [
+            self.record(41040, URL_MAP_FOR_CONTENT=None, description=None),
+            self.record('41041', title={'en': 'Objects'}),
+        ])
+        out = self.run_import('--file', path)
+
+        assert 'Total courses created: 1' in out
+        course = Course.objects.get()
+        assert course.code == '41040'
+        assert course.description == ''
+        assert course.page_reference == HANDBOOK_URL
+
+    def test_imports_newline_delimited_files_from_folder(self, tmp_path):
+        (tmp_path / 'law.jsonl').write_text('\n'.join(json.dumps(self.record(f'8000{i}')) for i in range(3)))
+        self.handbook(tmp_path, [self.record('80009')], name='science.json')
+
+        out = self.run_import('--folder', str(tmp_path))
+        assert 'Total courses created: 4' in out
+
+    def test_parallel_workers_import_every_file(self, tmp_path):
+        for faculty in range(3):
+            self.handbook(tmp_path, [self.record(f'8{faculty}{i:03d}') for i in range(5)], name=f'{faculty}.json')
+        (tmp_path / 'broken.json').write_text('[{"code": "81234", "title": "Broken"}, {')
+        (tmp_path / 'invalid.json').write_text(json.dumps([{'code': '89999'}]))
+
+        out, err = StringIO(), StringIO()
+        call_command('import_courses', '--folder', str(tmp_path), '--workers', '2', '--batch-size', '2',
+                     stdout=out, stderr=err)
+
+        assert 'Total courses created: 16' in out.getvalue()
+        assert '5 created, 0 changed, 0 unchanged from 1.json' in out.getvalue()
+        assert 'Error reading broken.json' in err.getvalue()
+        assert 'Skipping invalid course in invalid.json: missing code or title' in err.getvalue()
+        assert Course.objects.filter(code='81234').exists()
+
+    def test_write_error_stops_parallel_workers(self, tmp_path, monkeypatch):
+        for faculty in range(4):
+            self.handbook(tmp_path, [self.record(f'8{faculty}{i:03d}') for i in range(50)], name=f'{faculty}.json')
+
+        def failing_upsert(courses, **kwargs):
+            raise RuntimeError('database went away')
+
+        monkeypatch.setattr(Course, 'bulk_upsert', failing_upsert)
+        # Batches of one fill the queue, so workers are blocked on it when the write fails
+        with pytest.raises(RuntimeError, match='database went away'):
+            self.run_import('--folder', str(tmp_path), '--workers', '2', '--batch-size', '1')
+
+    def test_unchanged_courses_are_not_rewritten(self, tmp_path):
+        records = [self.record(f'7{i:04d}') for i in range(4)]
+        self.run_import('--file', self.handbook(tmp_path, records))
+        versions = dict(Course.objects.values_list('code', 'version'))
+
+        records[0]['title'] = 'Renamed'
+        out = self.run_import('--file', self.handbook(tmp_path, records))
+        assert 'Total courses created: 0' in out
+        assert 'Total courses changed: 1' in out
+        assert 'Total courses unchanged: 3' in out
+        assert Course.objects.get(code='70001').version == versions['70001']
+        assert Course.objects.get(code='70000').version == versions['70000'] + 1
+
+        path = self.handbook(tmp_path, records)
+        with CaptureQueriesContext(connection) as queries:
+            out = self.run_import('--file', path)
+        assert 'Total courses unchanged: 4' in out
+        # Just the lookup of stored fingerprints
+        assert [query['sql'] for query in queries if query['sql'].startswith(('INSERT', 'UPDATE', 'DELETE'))] == []
+
+    def test_edited_course_is_reimported(self, tmp_path):
+        path = self.handbook(tmp_path, [self.record('70000')])
+        self.run_import('--file', path)
+        course = Course.objects.get(code='70000')
+        course.name = 'Edited By Hand'
+        course.save()
+
+        assert 'Total courses changed: 1' in self.run_import('--file', path)
+        assert Course.objects.get(code='70000').name == 'Imported Course'
+
+    def test_level_is_part_of_the_fingerprint(self, tmp_path):
+        path = self.handbook(tmp_path, [self.record('70000')])
+        self.run_import('--file', path)
+
+        assert 'Total courses changed: 1' in self.run_import('--file', path, '--postgrad')
+        assert Course.objects.get(code='70000').level == 'PG'
+
+    def test_repeated_code_keeps_last_record(self, tmp_path):
+        path = self.handbook(tmp_path, [self.record('80001', title='First'), self.record('80001', title='Last')])
+        self.run_import('--file', path)
+        assert Course.objects.get(code='80001').name == 'Last'
+
+
+@pytest.mark.django_db
+class TestResumableImport:
+
+    @pytest.fixture
+    def folder(self, tmp_path):
+        for name, prefix in (('a.json', '71'), ('b.json', '72')):
+            records = [{'code': f'{prefix}{i:03d}', 'title': f'Course {prefix}{i}'} for i in range(5)]
+            (tmp_path / name).write_text(json.dumps(records))
+        return tmp_path
+
+    def run_import(self, folder, *args):
+        out = StringIO()
+        call_command('import_courses', '--folder', str(folder), '--batch-size', '2', *args,
+                     stdout=out, stderr=StringIO())
+        return out.getvalue()
+
+    def interrupt(self, monkeypatch, folder, failing_code='72003'):
+        """Run an import that dies on the batch holding ``failing_code``"""
+        bulk_upsert = Course.bulk_upsert
+
+        def failing_upsert(courses, **kwargs):
+            if any(course.code == failing_code for course in courses):
+                raise RuntimeError('container killed')
+            return bulk_upsert(courses, **kwargs)
+
+        monkeypatch.setattr(Course, 'bulk_upsert', failing_upsert)
+        with pytest.raises(RuntimeError):
+            self.run_import(folder)
+        monkeypatch.setattr(Course, 'bulk_upsert', bulk_upsert)
+
+    def test_journal_records_committed_batches(self, monkeypatch, folder):
+        self.interrupt(monkeypatch, folder)
+
+        journal = {Path(checkpoint.path).name: checkpoint for checkpoint in ImportCheckpoint.objects.all()}
+        assert journal['a.json'].completed and journal['a.json'].records == 5
+        assert not journal['b.json'].completed and journal['b.json'].records == 2
+        assert Course.objects.count() == 7
+
+    @pytest.mark.parametrize('workers', ['1', '2'])
+    def test_resume_only_does_the_remaining_work(self, monkeypatch, folder, workers):
+        self.interrupt(monkeypatch, folder)
+
+        out = self.run_import(folder, '--resume', '--workers', workers)
+        assert 'Skipping a.json, already imported' in out
+        assert 'Resuming b.json after 2 records' in out
+        assert 'Total courses processed: 3' in out
+        assert Course.objects.count() == 10
+        assert ImportCheckpoint.objects.filter(completed=True).count() == 2
+
+    def test_without_resume_starts_over(self, folder):
+        self.run_import(folder)
+        out = self.run_import(folder)
+        assert 'Total courses unchanged: 10' in out
+
+    @pytest.mark.parametrize('delete', [['--delete-all'], ['--delete-by', '--level', 'UG']])
+    def test_deleting_courses_clears_the_journal(self, folder, delete):
+        self.run_import(folder)
+        call_command('import_courses', *delete, stdout=StringIO())
+
+        assert not ImportCheckpoint.objects.exists()
+        out = self.run_import(folder, '--resume')
+        assert 'Total courses created: 10' in out
+        assert Course.objects.count() == 10
+
+    def test_edited_file_is_imported_again(self, folder):
+        self.run_import(folder)
+        (folder / 'a.json').write_text(json.dumps([{'code': '71000', 'title': 'Edited Title Here'}]))
+
+        out = self.run_import(folder, '--resume')
+        assert 'Skipping b.json, already imported' in out
+        assert 'Total courses changed: 1' in out
+        assert ImportCheckpoint.objects.count() == 2
+
+
+class TestHandbookReader:
+
+    courses = [{'code': '31251', 'title': 'Data Structures', 'n': 12345}, {'code': '31252', 'title': 'Ünïcode [x]'}]
+
+    def read(self, text):
+        # A tiny chunk size makes values straddle buffer refills
+        return list(read_records(StringIO(text), chunk_size=7))
+
+    @pytest.mark.parametrize('key', ['subjects', 'courses', 'data'])
+    def test_wrapped_array(self, key):
+        text = json.dumps({'meta': {'count': 2}, key: self.courses, 'trailer': 1})
+        assert self.read(text) == self.courses
+
+    def test_top_level_list(self):
+        assert self.read(json.dumps(self.courses, indent=2)) == self.courses
+
+    def test_single_course_object(self):
+        assert self.read(json.dumps(self.courses[0])) == [self.courses[0]]
+
+    def test_non_list_data_is_a_course(self):
+        record = {'code': '31251', 'title': 'Data', 'data': 'not a list'}
+        assert self.read(json.dumps(record)) == [record]
+
+    def test_newline_delimited(self):
+        text = '\n'.join(json.dumps(course) for course in self.courses) + '\n'
+        assert self.read(text) == self.courses
+
+    def test_empty_input(self):
+        assert self.read('  \n') == []
+        assert self.read('{"subjects": []}') == []
+
+    def test_syntax_error_after_valid_records(self):
+        records = read_records(StringIO('[{"code": "1"}, {"code": '), chunk_size=7)
+        assert next(records) == {'code': '1'}
+        with pytest.raises(ValueError):
+            next(records)
+
+    @pytest.mark.parametrize('text', [
+        '[{"code": "1"}] [{"code": "2"}]',
+        '[{"code": "1"}]garbage',
+        '{"subjects": [{"code": "1"}], "trailer": 1} {"code": "2"}',
+        '{"subjects": [{"code": "1"}], "trailer": }',
+    ])
+    def test_trailing_data_after_course_array(self, text):
+        records = read_records(StringIO(text), chunk_size=7)
+        assert next(records) == {'code': '1'}
+        with pytest.raises(ValueError):
+            next(records)
+
+    def test_values_cut_off_at_chunk_boundaries(self):
+        records = [{'n': 1e5, 'e': 'caf\u00e9 \U0001f600', 'b': True, 'x': -12.5}] * 3
+        for chunk_size in range(1, 20):
+            assert list(read_records(StringIO(json.dumps(records)), chunk_size=chunk_size)) == records
+
+    def test_early_syntax_error_in_large_file_stops_reading(self):
+        filler = ', '.join(json.dumps({'code': str(n), 'title': 'x' * 100}) for n in range(50000))
+        file = StringIO(f'[{{"code": "1"}}, {{"code": 2 3}}, {filler}]')
+        records = read_records(file, chunk_size=1024)
+
+        assert next(records) == {'code': '1'}
+        with pytest.raises(ValueError):
+            next(records)
+        assert file.tell() <= 1024
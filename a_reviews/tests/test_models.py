@@ -1,5 +1,6 @@
 import pytest
 from decimal import Decimal
+from a_reviews.forms import ReviewForm
 from a_reviews.models import Course, Review
 from django.contrib.auth.models import User
 
@@ -155,27 +156,55 @@ class TestCourseModel:
         assert course.faculty is None
     
     def test_default_course_ordering(self):
-        """Test that courses are ordered correctly by overall_rating, review_count"""
+        """Test that courses are ordered by confidence-weighted rating"""
         # Create courses with different ratings and review counts
         course1 = Course.objects.create(
             code="CS101", name="Course 1", description="Desc 1",
-            overall_rating=4.0, review_count=10
+            overall_rating=4.0, overall_rating_sum=40, review_count=10
         )
         course2 = Course.objects.create(
             code="CS102", name="Course 2", description="Desc 2",
-            overall_rating=4.5, review_count=5
+            overall_rating=4.5, overall_rating_sum=23, review_count=5
         )
         course3 = Course.objects.create(
             code="CS103", name="Course 3", description="Desc 3",
-            overall_rating=4.5, review_count=15
+            overall_rating=4.5, overall_rating_sum=68, review_count=15
+        )
+        course4 = Course.objects.create(
+            code="CS104", name="Course 4", description="Desc 4",
+            overall_rating=5.0, overall_rating_sum=5, review_count=1
         )
         
         courses = list(Course.objects.all())
         
         # Test the ordering principles
-        assert courses[0].overall_rating == 4.5 and courses[0].review_count == 15  # Highest rating + count
-        assert courses[1].overall_rating == 4.5 and courses[1].review_count == 5   # Same rating, lower count
-        assert courses[2].overall_rating == 4.0 and courses[2].review_count == 10  # Lower rating, lower count
+        assert courses[0] == course3  # High rating backed by many reviews
+        assert courses[1] == course2  # Same rating, fewer reviews
+        assert courses[2] == course1  # Lower rating, more reviews
+        assert courses[3] == course4  # A single 5 star review isn't enough to lead
+
+    def test_ordering_precedence(self):
+        """UG before PG and courses with sessions before those without, whatever the rating"""
+        pg = Course.objects.create(code="PG1", name="PG", description="", level='PG',
+                                   has_sessions=True, overall_rating_sum=250, review_count=50)
+        unavailable = Course.objects.create(code="UG1", name="No sessions", description="",
+                                            has_sessions=False, overall_rating_sum=250, review_count=50)
+        offered = Course.objects.create(code="UG2", name="Offered", description="",
+                                        has_sessions=True, overall_rating_sum=50, review_count=50)
+
+        assert list(Course.objects.all()) == [offered, unavailable, pg]
+
+    def test_rank_score_follows_review_writes(self, course, user):
+        """rank_score is kept in step with the incremental aggregates"""
+        Review.objects.create(
+            course=course, author=user,
+            overall_rating=5, enjoyment=5, usefullness=5, manageability=5,
+            course_completion="2024-Autumn"
+        )
+        course.refresh_from_db()
+
+        assert course.rank_score == pytest.approx(course.compute_rank_score())
+        assert course.rank_score == pytest.approx(20.0 + (15 + 5) / 6)
     
     @pytest.mark.parametrize("rating_values,expected_averages", [
         # Test case 1: All same values
@@ -208,4 +237,163 @@ class TestCourseModel:
         assert course.enjoyment == expected_enjoyment
         assert course.usefullness == expected_usefullness
         assert course.manageability == expected_manageability
-        assert course.review_count == len(rating_values)
\ No newline at end of file
+        assert course.review_count == len(rating_values)
+
+@pytest.mark.django_db
+class TestIncrementalRatings:
+
+    def test_create_review_updates_sums_and_averages(self, course, user, user2):
+        """Creating reviews shifts the running sums without a full re-aggregation"""
+        Review.objects.create(
+            course=course, author=user,
+            overall_rating=4, enjoyment=4, usefullness=5, manageability=3,
+            course_completion="2024-Autumn"
+        )
+        Review.objects.create(
+            course=course, author=user2,
+            overall_rating=3, enjoyment=2, usefullness=3, manageability=5,
+            course_completion="2024-Spring"
+        )
+        course.refresh_from_db()
+
+        assert course.review_count == 2
+        assert course.overall_rating_sum == 7
+        assert course.enjoyment_sum == 6
+        assert course.overall_rating == 3.5
+        assert course.usefullness == 4.0
+        assert course.manageability == 4.0
+
+    def test_edit_review_applies_difference(self, course, user):
+        """Editing a review only applies the change in scores"""
+        review = Review.objects.create(
+            course=course, author=user,
+            overall_rating=2, enjoyment=2, usefullness=2, manageability=2,
+            course_completion="2024-Autumn"
+        )
+        review.overall_rating = 5
+        review.save()
+        course.refresh_from_db()
+
+        assert course.review_count == 1
+        assert course.overall_rating_sum == 5
+        assert course.overall_rating == 5.0
+        assert course.enjoyment == 2.0
+
+    def test_delete_review_removes_scores(self, course_with_two_reviews):
+        """Deleting reviews subtracts them and resets to zero when none are left"""
+        course, reviews = course_with_two_reviews
+        reviews[0].delete()
+        course.refresh_from_db()
+
+        assert course.review_count == 1
+        assert course.overall_rating == float(reviews[1].overall_rating)
+
+        reviews[1].author.delete()  # cascade delete goes through post_delete too
+        course.refresh_from_db()
+
+        assert course.review_count == 0
+        assert course.overall_rating_sum == 0
+        assert course.overall_rating == 0.0
+
+    def test_write_cost_is_constant(self, course, user, django_assert_max_num_queries):
+        """A review write does not scan the course's existing reviews"""
+        for i in range(10):
+            other = User.objects.create_user(username=f"bulk{i}", password="pass")
+            Review.objects.create(
+                course=course, author=other,
+                overall_rating=3, enjoyment=3, usefullness=3, manageability=3,
+                course_completion="2024-Autumn"
+            )
+
+        with django_assert_max_num_queries(4):
+            Review.objects.create(
+                course=course, author=user,
+                overall_rating=5, enjoyment=5, usefullness=5, manageability=5,
+                course_completion="2024-Autumn"
+            )
+
+
+@pytest.mark.django_db
+class TestRatingHistogram:
+
+    def make_review(self, course, username, stars):
+        user = User.objects.create_user(username=username, password="pass")
+        return Review.objects.create(
+            course=course, author=user,
+            overall_rating=stars, enjoyment=stars, usefullness=stars, manageability=stars,
+            course_completion="2024-Autumn"
+        )
+
+    def counts(self, course, field):
+        course = Course.objects.select_related('histogram').get(pk=course.pk)
+        dimension = next(d for d in course.rating_distribution if d['field'] == field)
+        return {bar['stars']: bar['count'] for bar in dimension['bars']}
+
+    def test_empty_course_distribution(self, course):
+        """Courses without reviews report zero counts without a histogram row"""
+        assert self.counts(course, 'overall_rating') == {5: 0, 4: 0, 3: 0, 2: 0, 1: 0}
+
+    def test_histogram_tracks_create_edit_delete(self, course):
+        first = self.make_review(course, "hist1", 5)
+        self.make_review(course, "hist2", 5)
+        self.make_review(course, "hist3", 2)
+        assert self.counts(course, 'enjoyment') == {5: 2, 4: 0, 3: 0, 2: 1, 1: 0}
+
+        first.enjoyment = 3
+        first.save()
+        assert self.counts(course, 'enjoyment') == {5: 1, 4: 0, 3: 1, 2: 1, 1: 0}
+        assert self.counts(course, 'overall_rating') == {5: 2, 4: 0, 3: 0, 2: 1, 1: 0}
+
+        first.delete()
+        assert self.counts(course, 'enjoyment') == {5: 1, 4: 0, 3: 0, 2: 1, 1: 0}
+
+    def test_update_ratings_rebuilds_histogram(self, course):
+        self.make_review(course, "hist4", 4)
+        course.histogram.delete()
+
+        course.update_ratings()
+        assert self.counts(course, 'manageability') == {5: 0, 4: 1, 3: 0, 2: 0, 1: 0}
+
+    def test_deleting_course_with_reviews(self, course):
+        self.make_review(course, "hist5", 4)
+        course.delete()
+        assert not Review.objects.exists()
+
+
+@pytest.mark.django_db
+class TestCompletionTerm:
+
+    @pytest.mark.parametrize("text, expected", [
+        ("2024-Autumn", (2024, 1)),
+        ("2024-JULY", (2024, 2)),
+        ("2023-Spring", (2023, 3)),
+        ("2023-SUMMER", (2023, 4)),
+        ("2022-OTHER", (2022, 0)),
+        ("sometime", (0, 0)),
+        ("", (0, 0)),
+    ])
+    def test_parse_completion(self, text, expected):
+        assert Review.parse_completion(text) == expected
+
+    def test_save_keeps_columns_in_sync(self, course, user):
+        review = Review.objects.create(
+            course=course, author=user, overall_rating=3, enjoyment=3, usefullness=3, manageability=3,
+            course_completion="2024-Spring"
+        )
+        review.course_completion = "2025-Autumn"
+        review.save(update_fields=['course_completion'])
+
+        review.refresh_from_db()
+        assert (review.completion_year, review.completion_term_ordinal) == (2025, 1)
+
+    def test_form_sets_completion(self, course, user):
+        form = ReviewForm({
+            'overall_rating': 4, 'enjoyment': 4, 'usefullness': 4, 'manageability': 4,
+            'completion_year': 2025, 'completion_session': 'SUMMER',
+        })
+        assert form.is_valid(), form.errors
+
+        review = form.save(commit=False)
+
+        assert review.course_completion == "2025-SUMMER"
+        assert (review.completion_year, review.completion_term_ordinal) == (2025, 4)
@@ -0,0 +1,857 @@
+import datetime
+import pytest
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.db.models import F
+from django.http import Http404, QueryDict
+from django.test.utils import CaptureQueriesContext
+from django.template.loader import render_to_string
+from django.urls import reverse
+from django.utils import timezone
+from a_reviews.factories import CourseFactory, ReviewFactory
+from a_reviews.caching import bump_catalogue_generation, result_cache_key
+from a_reviews.filters import CourseFilter, ReviewFilter
+from a_reviews.models import CatalogueGeneration, Course, Review, deferred_rating_updates
+from a_reviews.pagination import KeysetPaginator, decode_cursor
+from a_reviews.search import AUTOCOMPLETE_LIMIT, FTS_TABLE
+from a_reviews import views
+from a_reviews.views import get_course_or_404
+
+
+def course_updates(queries):
+    """Count the UPDATE statements issued against the course table"""
+    return sum(1 for q in queries if q['sql'].startswith('UPDATE "a_reviews_course"'))
+
+
+def without_generation_lookups(queries):
+    """Captured queries other than the catalogue generation read every cached view makes"""
+    return [query for query in queries if CatalogueGeneration._meta.db_table not in query['sql']]
+
+
+@pytest.mark.django_db
+class TestRatingWrites:
+
+    def test_create_review_updates_course_once(self, client, user, course):
+        client.force_login(user)
+        data = {
+            'overall_rating': 4, 'enjoyment': 3, 'usefullness': 5, 'manageability': 2,
+            'completion_year': datetime.date.today().year,
+            'completion_session': 'AUTUMN',
+        }
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.post(reverse('htmx-create-review', args=[course.code]), data)
+
+        assert response.status_code == 200
+        assert course_updates(ctx.captured_queries) == 1
+        assert not any('AVG(' in q['sql'] or 'SUM(' in q['sql'] for q in ctx.captured_queries)
+
+        course.refresh_from_db()
+        assert course.review_count == 1
+        assert course.overall_rating == 4.0
+        assert response.context['course'].overall_rating == 4.0
+
+    def test_create_review_shows_updated_distribution(self, client, user, course):
+        client.force_login(user)
+        # Cache the course, histogram and all, before the review lands
+        client.get(reverse('course-detail', args=[course.code]))
+        data = {
+            'overall_rating': 4, 'enjoyment': 3, 'usefullness': 5, 'manageability': 2,
+            'completion_year': datetime.date.today().year,
+            'completion_session': 'AUTUMN',
+        }
+
+        response = client.post(reverse('htmx-create-review', args=[course.code]), data)
+
+        overall = response.context['course'].rating_distribution[0]
+        assert overall['total'] == 1
+        assert next(bar for bar in overall['bars'] if bar['stars'] == 4)['count'] == 1
+
+    @pytest.mark.django_db(transaction=True)
+    def test_review_write_bumps_generation_once_after_commit(self, user, course):
+        table = CatalogueGeneration._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            with transaction.atomic():
+                ReviewFactory(course=course, author=user)
+
+        bumps = [q['sql'] for q in ctx.captured_queries if table in q['sql']]
+        assert len(bumps) == 1
+        assert ctx.captured_queries[-1]['sql'] == bumps[0]
+        assert bumps[0].startswith(f'UPDATE "{table}"')
+
+    def test_delete_review_updates_course_once(self, client, review):
+        client.force_login(review.author)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.delete(reverse('htmx-delete-review', args=[review.id]))
+
+        assert response.status_code == 200
+        assert course_updates(ctx.captured_queries) == 1
+        review.course.refresh_from_db()
+        assert review.course.review_count == 0
+        assert review.course.overall_rating == 0.0
+
+    def test_delete_account_updates_each_course_once(self, client, user, other_user, courses):
+        for course in courses:
+            ReviewFactory(course=course, author=user)
+            ReviewFactory(course=course, author=other_user)
+        client.force_login(user)
+
+        with CaptureQueriesContext(connection) as ctx:
+            client.post(reverse('delete-account'))
+
+        assert course_updates(ctx.captured_queries) == len(courses)
+        for course in courses:
+            course.refresh_from_db()
+            remaining = Review.objects.get(course=course)
+            assert course.review_count == 1
+            assert course.overall_rating == float(remaining.overall_rating)
+
+    def test_deferred_updates_coalesce_per_course(self, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        ReviewFactory(course=course)
+
+        with CaptureQueriesContext(connection) as ctx:
+            with deferred_rating_updates():
+                course.review_set.all().delete()
+
+        assert course_updates(ctx.captured_queries) == 1
+        course.refresh_from_db()
+        assert course.review_count == 0
+        assert course.overall_rating_sum == 0
+
+
+@pytest.mark.django_db
+class TestCourseDetail:
+
+    def test_detail_shows_rating_distribution(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+
+        response = client.get(reverse('course-detail', args=[course.code]))
+
+        assert response.status_code == 200
+        assert 'id="review-bars"' in response.content.decode()
+        overall = response.context['course'].rating_distribution[0]
+        assert overall['field'] == 'overall_rating'
+        assert overall['total'] == 2
+
+    def test_bars_show_the_three_rating_dimensions(self, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+
+        html = render_to_string('a_reviews/detail_components/review_bars.html', {'course': course})
+
+        assert [label for label in ('Overall', 'Enjoyment', 'Usefulness', 'Manageability') if label in html] == [
+            'Enjoyment', 'Usefulness', 'Manageability'
+        ]
+        assert html.count('&#9733;') == 15
+
+
+@pytest.mark.django_db
+class TestCourseFilters:
+
+    def filtered_codes(self, client, **params):
+        response = client.get(reverse('filter_courses'), params)
+        return {course.code for course in response.context['courses']}
+
+    def test_session_filter_matches_any_selected_session(self, client):
+        autumn = CourseFactory(sessions=['Autumn'], has_sessions=True)
+        spring = CourseFactory(sessions=['Spring', 'Summer'], has_sessions=True)
+        CourseFactory(sessions=['July'], has_sessions=True)
+
+        assert self.filtered_codes(client, session=['Autumn', 'Summer']) == {autumn.code, spring.code}
+
+    def test_unavailable_uses_has_sessions(self, client):
+        unavailable = CourseFactory(sessions=[], has_sessions=False)
+        CourseFactory(sessions=['Autumn'], has_sessions=True)
+
+        assert self.filtered_codes(client, session=['Unavailable']) == {unavailable.code}
+
+    def test_session_rows_follow_course_edits(self, client):
+        course = CourseFactory(sessions=['Autumn'], has_sessions=True)
+        course.sessions = ['Spring']
+        course.save()
+
+        assert self.filtered_codes(client, session=['Autumn']) == set()
+        assert self.filtered_codes(client, session=['Spring']) == {course.code}
+
+    def test_session_filter_is_one_query(self, client, django_assert_max_num_queries):
+        CourseFactory.create_batch(3, sessions=['Autumn'], has_sessions=True)
+        course_filter = CourseFilter({'session': ['Autumn', 'Unavailable']}, queryset=Course.objects.all())
+
+        with django_assert_max_num_queries(1):
+            assert len(list(course_filter.qs)) == 3
+
+    def test_search_covers_code_and_description_by_relevance(self, client):
+        by_code = CourseFactory(code="COMP1001", name="Programming Basics", description="Loops.")
+        by_name = CourseFactory(code="41000", name="Compilers", description="Parsing.")
+        by_description = CourseFactory(code="42000", name="Networks", description="Routing and compression.")
+        CourseFactory(code="43000", name="Ethics", description="Philosophy.")
+
+        response = client.get(reverse('filter_courses'), {'search': 'comp'})
+        codes = [course.code for course in response.context['courses']]
+
+        assert set(codes) == {by_code.code, by_name.code, by_description.code}
+        assert codes[-1] == by_description.code  # description hits are weighted lowest
+
+    def test_search_index_follows_edits(self, client):
+        course = CourseFactory(name="Machine Learning")
+        course.name = "Deep Learning"
+        course.save()
+
+        assert self.filtered_codes(client, search='machine') == set()
+        assert self.filtered_codes(client, search='deep learn') == {course.code}
+
+    def test_deleted_courses_leave_the_search_index(self, client):
+        course = CourseFactory(name="Machine Learning")
+        kept = CourseFactory(name="Machine Vision")
+        course.delete()
+
+        with connection.cursor() as cursor:
+            cursor.execute(f'SELECT rowid FROM {FTS_TABLE}')
+            assert [row[0] for row in cursor.fetchall()] == [kept.pk]
+
+    def test_search_ignores_query_syntax(self, client):
+        course = CourseFactory(name="Data Structures")
+
+        assert self.filtered_codes(client, search='"data" (struct* -:') == {course.code}
+
+    def test_fuzzy_search_tolerates_typos(self, client):
+        course = CourseFactory(code="41040", name="Machine Learning")
+        CourseFactory(code="41041", name="Ancient History")
+
+        response = client.get(reverse('filter_courses'), {'search': 'machne lerning'})
+
+        assert [c.code for c in response.context['courses']] == [course.code]
+
+    def test_fuzzy_search_ranks_by_similarity(self, client):
+        close = CourseFactory(code="31251", name="Data Structures and Algorithms")
+        partial = CourseFactory(code="31252", name="Data Visualisation")
+
+        response = client.get(reverse('filter_courses'), {'search': 'data structres'})
+        codes = [c.code for c in response.context['courses']]
+
+        assert codes[0] == close.code
+        assert partial.code not in codes or codes.index(partial.code) > 0
+
+
+@pytest.mark.django_db
+class TestCoursePagination:
+
+    @pytest.fixture
+    def catalogue(self):
+        """Enough courses for several pages, with tied ratings so the tiebreak matters"""
+        courses = CourseFactory.create_batch(13, description="Intro to computing.")
+        for index, course in enumerate(courses):
+            Course.objects.filter(pk=course.pk).update(
+                overall_rating=index % 3, enjoyment=index % 2, name=f"Course {index % 4}"
+            )
+        return courses
+
+    def scroll(self, client, **params):
+        """Follow the infinite scroll cursors to the end and return every course code in order"""
+        page = client.get(reverse('filter_courses'), params).context['courses']
+        return [course.code for course in page] + self.scroll_from(client, page, **params)
+
+    def scroll_from(self, client, page, **params):
+        codes = []
+        while page.has_next:
+            page = client.get(reverse('get-courses'), {**params, 'cursor': page.next_cursor}).context['courses']
+            codes += [course.code for course in page]
+        return codes
+
+    @pytest.mark.parametrize('sort', [None, 'name', '-name', '-overall_rating', '-enjoyment',
+                                      '-usefullness', '-manageability'])
+    def test_scroll_covers_every_sort_in_order(self, client, catalogue, sort):
+        params = {'sort': sort} if sort else {}
+        queryset = CourseFilter(params, queryset=Course.objects.all()).qs
+        ordering = list(queryset.query.order_by or Course._meta.ordering)
+        expected = queryset.order_by(*ordering, '-pk' if ordering[-1].startswith('-') else 'pk')
+
+        assert self.scroll(client, **params) == list(expected.values_list('code', flat=True))
+
+    def test_scroll_covers_search_results(self, client, catalogue):
+        codes = self.scroll(client, search='computing')
+
+        assert sorted(codes) == sorted(course.code for course in catalogue)
+
+    def test_next_page_skips_count_and_offset(self, client, catalogue):
+        first = client.get(reverse('filter_courses'), {'sort': '-overall_rating'}).context['courses']
+
+        with CaptureQueriesContext(connection) as ctx:
+            client.get(reverse('get-courses'), {'sort': '-overall_rating', 'cursor': first.next_cursor})
+
+        sql = ' '.join(q['sql'] for q in ctx.captured_queries)
+        assert 'COUNT(' not in sql
+        assert 'OFFSET' not in sql
+
+    def test_rating_change_does_not_shift_later_pages(self, client, catalogue):
+        first = client.get(reverse('filter_courses')).context['courses']
+        # A course already shown drops to the bottom of the ranking mid-scroll
+        Course.objects.filter(code=first[0].code).update(rank_score=-1)
+        bump_catalogue_generation()
+
+        rest = self.scroll_from(client, first)
+
+        assert rest[-1] == first[0].code
+        assert not {course.code for course in first} & set(rest[:-1])
+        assert len(rest) == len(catalogue) - len(first) + 1
+
+    def test_scroll_continues_past_the_cached_rows(self, client, catalogue, monkeypatch):
+        monkeypatch.setattr(views, 'RESULT_CACHE_ROWS', 7)
+        expected = list(Course.objects.order_by('name', 'pk').values_list('code', flat=True))
+
+        assert self.scroll(client, sort='name') == expected
+
+    def test_default_feed_is_not_cached(self, client, catalogue):
+        client.get(reverse('filter_courses'))
+
+        assert cache.get(result_cache_key('course-results', QueryDict())) is None
+
+    def feed_query_plans(self, client, params):
+        """EXPLAIN QUERY PLAN of each course page query a get-courses request runs"""
+        with CaptureQueriesContext(connection) as ctx:
+            client.get(reverse('get-courses'), params)
+        plans = []
+        with connection.cursor() as cursor:
+            for query in ctx.captured_queries:
+                if 'FROM "a_reviews_course"' in query['sql'] and 'LIMIT' in query['sql']:
+                    cursor.execute(f"EXPLAIN QUERY PLAN {query['sql']}")
+                    plans.append(' '.join(str(row) for row in cursor.fetchall()))
+        return plans
+
+    def test_default_feed_pages_are_index_seeks(self, client, catalogue):
+        first = client.get(reverse('filter_courses')).context['courses']
+
+        [first_plan] = self.feed_query_plans(client, {})
+        [later_plan] = self.feed_query_plans(client, {'cursor': first.next_cursor})
+
+        assert 'course_rank_idx' in first_plan and 'TEMP B-TREE' not in first_plan
+        assert 'SEARCH' in later_plan and 'course_rank_idx' in later_plan and 'TEMP B-TREE' not in later_plan
+
+    def test_malformed_cursor_starts_over(self, client, catalogue):
+        response = client.get(reverse('get-courses'), {'cursor': 'not-a-cursor'})
+
+        assert response.status_code == 200
+        assert len(response.context['courses']) == 5
+
+
+@pytest.mark.django_db
+class TestReviewPagination:
+
+    @pytest.fixture
+    def reviewed_course(self, course):
+        """A course with enough reviews for several pages, with tied ratings and completions"""
+        for index in range(12):
+            ReviewFactory(course=course, overall_rating=index % 3 + 1, course_completion=f"202{index % 4}-Autumn")
+        return course
+
+    def scroll(self, client, course, **params):
+        """Follow the review feed cursors to the end and return every review id in order"""
+        page = client.get(reverse('filter_reviews', args=[course.code]), params).context['reviews']
+        ids = [review.id for review in page]
+        while page.has_next:
+            page = client.get(reverse('get-reviews'), {
+                **params, 'course_code': course.code, 'cursor': page.next_cursor
+            }).context['reviews']
+            ids += [review.id for review in page]
+        return ids
+
+    @pytest.mark.parametrize('sort, ordering', [
+        ('-review_date', ['-review_date', '-id']),
+        ('-course_completion', ['-completion_year', '-completion_term_ordinal', '-id']),
+        ('-overall_rating', ['-overall_rating', '-id']),
+        ('overall_rating', ['overall_rating', 'id']),
+    ])
+    def test_scroll_covers_every_sort_in_order(self, client, reviewed_course, sort, ordering):
+        expected = reviewed_course.review_set.order_by(*ordering).values_list('id', flat=True)
+
+        assert self.scroll(client, reviewed_course, sort=sort) == list(expected)
+
+    def test_most_recently_taken_is_chronological(self, client, course):
+        spring = ReviewFactory(course=course, course_completion="2024-Spring")
+        autumn = ReviewFactory(course=course, course_completion="2024-Autumn")
+        summer = ReviewFactory(course=course, course_completion="2024-Summer")
+        older = ReviewFactory(course=course, course_completion="2023-Summer")
+
+        ids = self.scroll(client, course, sort='-course_completion')
+
+        assert ids == [summer.id, spring.id, autumn.id, older.id]
+
+    def test_default_scroll_is_most_recent_first(self, client, reviewed_course):
+        expected = reviewed_course.review_set.order_by('-review_date', '-id').values_list('id', flat=True)
+
+        assert self.scroll(client, reviewed_course) == list(expected)
+
+    def test_sub_millisecond_review_dates_are_not_skipped(self, client, settings, course):
+        settings.PAGE_SIZE = 3
+        reviews = ReviewFactory.create_batch(8, course=course)
+        start = timezone.now()
+        for offset, review in enumerate(reviews):
+            Review.objects.filter(pk=review.pk).update(review_date=start + datetime.timedelta(microseconds=offset * 10))
+
+        expected = course.review_set.order_by('-review_date', '-id').values_list('id', flat=True)
+        assert self.scroll(client, course) == list(expected)
+
+    def test_taken_year_range(self, client, reviewed_course):
+        expected = reviewed_course.review_set.filter(
+            completion_year__range=(2021, 2022)
+        ).order_by('-completion_year', '-completion_term_ordinal', '-id').values_list('id', flat=True)
+
+        ids = self.scroll(client, reviewed_course, sort='-course_completion', taken_min=2021, taken_max=2022)
+
+        assert ids == list(expected) and len(ids) == 6
+
+    def test_taken_year_range_is_an_index_range_scan(self, reviewed_course):
+        queryset = ReviewFilter(
+            {'sort': '-course_completion', 'taken_min': '2022'}, queryset=reviewed_course.review_set.all()
+        ).qs[:5]
+
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+
+        assert 'review_course_term_idx (course_id=? AND completion_year>?)' in plan
+        assert 'TEMP B-TREE' not in plan
+
+    @pytest.mark.parametrize('sort, index', [
+        ('-review_date', 'review_course_date_idx'),
+        ('-overall_rating', 'review_course_rating_idx'),
+        ('overall_rating', 'review_course_rating_idx'),
+        ('-course_completion', 'review_course_term_idx'),
+    ])
+    def test_page_is_served_by_composite_index(self, reviewed_course, sort, index):
+        queryset = ReviewFilter({'sort': sort}, queryset=reviewed_course.review_set.all()).qs
+        paginator = KeysetPaginator(queryset, 5)
+        ordering, values = decode_cursor(paginator.page().next_cursor)
+        queryset = paginator.queryset.filter(paginator.after(values))[:5]
+
+        sql, params = queryset.query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+            plan = ' '.join(str(row) for row in cursor.fetchall())
+
+        assert index in plan
+        assert 'TEMP B-TREE' not in plan
+
+
+@pytest.mark.django_db
+class TestReviewFeedQueries:
+
+    @pytest.fixture
+    def busy_course(self, course):
+        """A course reviewed by many different authors"""
+        ReviewFactory.create_batch(12, course=course)
+        return course
+
+    def count_queries(self, client, url, params=None):
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url, params or {})
+        assert response.status_code == 200
+        return len(ctx.captured_queries)
+
+    @pytest.mark.parametrize('view', ['course-detail', 'filter_reviews', 'get-reviews'])
+    def test_course_feeds_use_fixed_queries_per_page(self, client, settings, busy_course, view):
+        if view == 'get-reviews':
+            url, params = reverse(view), {'course_code': busy_course.code}
+        else:
+            url, params = reverse(view, args=[busy_course.code]), {}
+
+        # Warm the course lookup cache so both counts see the same hits
+        self.count_queries(client, url, params)
+        settings.PAGE_SIZE = 2
+        small = self.count_queries(client, url, params)
+        settings.PAGE_SIZE = 10
+        large = self.count_queries(client, url, params)
+
+        assert small == large
+
+    def test_user_page_uses_fixed_queries(self, client, settings, user):
+        for course in CourseFactory.create_batch(6):
+            ReviewFactory(course=course, author=user)
+        client.force_login(user)
+        url = reverse('user-page')
+
+        baseline = self.count_queries(client, url)
+        for course in CourseFactory.create_batch(6):
+            ReviewFactory(course=course, author=user)
+
+        assert self.count_queries(client, url) == baseline
+
+    def test_feed_renders_authors_without_extra_queries(self, busy_course, django_assert_num_queries):
+        with django_assert_num_queries(1):
+            authors = [(review.author.username, review.course.name) for review in Review.objects.feed()]
+
+        assert len(authors) == 12
+
+
+@pytest.mark.django_db
+class TestCourseCardCache:
+
+    def home_page(self, client):
+        response = client.get(reverse('course-list'))
+        return response.content.decode()
+
+    def test_cards_are_served_from_cache(self, client, course):
+        self.home_page(client)
+        # A write that skips save() leaves the version, and so the cached card, untouched
+        Course.objects.filter(pk=course.pk).update(name="Renamed Behind The Cache")
+
+        assert "Renamed Behind The Cache" not in self.home_page(client)
+
+    def test_save_invalidates_card(self, client, course):
+        self.home_page(client)
+        course.name = "Renamed Course"
+        course.save()
+
+        assert "Renamed Course" in self.home_page(client)
+
+    def test_review_write_invalidates_card(self, client, course, user):
+        assert "0 Reviews" in self.home_page(client)
+        ReviewFactory(course=course, author=user)
+
+        assert "1 Reviews" in self.home_page(client)
+
+    def test_update_ratings_bumps_version(self, course):
+        version = course.version
+        course.update_ratings()
+
+        assert course.version == version + 1
+        course.refresh_from_db()
+        assert course.version == version + 1
+
+
+@pytest.mark.django_db
+class TestCourseLookupCache:
+
+    def test_repeat_lookups_skip_the_database(self, course):
+        get_course_or_404(course.code)
+        with CaptureQueriesContext(connection) as queries:
+            cached = get_course_or_404(course.code)
+
+        assert cached == course
+        assert len(queries) == 0
+
+    def test_unknown_code_is_404(self):
+        with pytest.raises(Http404):
+            get_course_or_404('NOPE')
+
+    def test_review_write_invalidates(self, course, user):
+        get_course_or_404(course.code)
+        ReviewFactory(course=course, author=user)
+
+        assert get_course_or_404(course.code).review_count == 1
+
+    def test_update_ratings_invalidates(self, course):
+        get_course_or_404(course.code)
+        Course.objects.filter(pk=course.pk).update(name="Renamed Behind The Cache")
+        assert get_course_or_404(course.code).name != "Renamed Behind The Cache"
+
+        course.update_ratings()
+        assert get_course_or_404(course.code).name == "Renamed Behind The Cache"
+
+    def test_renamed_code_is_not_served_from_cache(self, course):
+        old_code = course.code
+        get_course_or_404(old_code)
+        course.code = 'NEW123'
+        course.save()
+        get_course_or_404('NEW123')
+
+        with pytest.raises(Http404):
+            get_course_or_404(old_code)
+
+
+@pytest.mark.django_db
+class TestCourseResultCache:
+
+    @pytest.fixture
+    def catalogue(self):
+        return CourseFactory.create_batch(12, faculty='Law', sessions=['Autumn'], has_sessions=True)
+
+    def codes(self, client, view='filter_courses', **params):
+        response = client.get(reverse(view), params)
+        return [course.code for course in response.context['courses']], response.context['courses']
+
+    def test_repeat_filters_skip_the_filter_query(self, client, catalogue):
+        params = {'faculty': 'Law', 'session': 'Autumn', 'sort': '-overall_rating'}
+        expected, _ = self.codes(client, **params)
+
+        with CaptureQueriesContext(connection) as ctx:
+            codes, page = self.codes(client, 'get-courses', **params)
+
+        # Only the pk__in fetch for the page itself, and the generation read once for the request
+        queries = without_generation_lookups(ctx.captured_queries)
+        assert codes == expected
+        assert len(queries) == 1
+        assert len(ctx.captured_queries) == 2
+        assert 'IN (' in queries[0]['sql']
+
+    def test_cursor_pages_come_from_the_cached_list(self, client, catalogue):
+        codes, page = self.codes(client, sort='name')
+        while page.has_next:
+            with CaptureQueriesContext(connection) as ctx:
+                more, page = self.codes(client, 'get-courses', sort='name', cursor=page.next_cursor)
+            assert len(without_generation_lookups(ctx.captured_queries)) == 1
+            codes += more
+
+        assert codes == list(Course.objects.order_by('name', 'pk').values_list('code', flat=True))
+
+    def test_generation_bumps_from_other_processes_retire_results(self, client, catalogue):
+        first, _ = self.codes(client, sort='name')
+        # All another process (import_courses, say) leaves behind: the rows and the generation counter
+        Course.objects.filter(code=first[0]).update(name='zzz')
+        CatalogueGeneration.objects.update(value=F('value') + 1)
+
+        codes, _ = self.codes(client, sort='name')
+        assert codes[0] != first[0]
+
+    def test_parameter_order_and_duplicates_share_an_entry(self, rf):
+        first = rf.get('/', {'session': ['Autumn', 'Spring'], 'faculty': 'Law', 'page': ['1', '2']}).GET
+        second = rf.get('/', {'faculty': ['Law', 'Law'], 'session': ['Spring', 'Autumn'], 'cursor': 'x'}).GET
+
+        assert result_cache_key('course-results', first) == result_cache_key('course-results', second)
+
+    def test_review_write_invalidates_results(self, client, catalogue, user):
+        self.codes(client, sort='-overall_rating')
+        ReviewFactory(course=catalogue[-1], author=user, overall_rating=5)
+
+        codes, _ = self.codes(client, sort='-overall_rating')
+
+        assert codes[0] == catalogue[-1].code
+
+    def test_course_writes_invalidate_results(self, client, catalogue):
+        self.codes(client, faculty='Law', sort='name')
+        course = CourseFactory(name='Aaa Introduction', faculty='Law')
+
+        codes, _ = self.codes(client, faculty='Law', sort='name')
+
+        assert codes[0] == course.code
+
+    def test_searches_are_not_cached(self, client, catalogue):
+        CourseFactory(name='Zzzz Studies')
+        self.codes(client, search='zzzz')
+
+        with CaptureQueriesContext(connection) as ctx:
+            codes, _ = self.codes(client, search='zzzz')
+
+        assert len(codes) == 1
+        assert any('MATCH' in q['sql'] for q in ctx.captured_queries)
+
+
+@pytest.mark.django_db
+class TestConditionalGet:
+
+    def revalidate(self, client, url, params=None):
+        """Fetch once, then again with the returned validators; return the second response"""
+        first = client.get(url, params or {})
+        assert first.status_code == 200 and first.has_header('ETag')
+        return client.get(url, params or {}, HTTP_IF_NONE_MATCH=first['ETag'])
+
+    def test_unchanged_course_list_is_not_modified(self, client, courses):
+        first = client.get(reverse('course-list'))
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+
+        # The ETag only needs the catalogue generation
+        assert response.status_code == 304
+        assert len(ctx.captured_queries) == 1
+        assert not without_generation_lookups(ctx.captured_queries)
+
+    def test_course_list_changes_after_review(self, client, course, user):
+        first = client.get(reverse('course-list'))
+        ReviewFactory(course=course, author=user)
+
+        response = client.get(reverse('course-list'), HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert response.status_code == 200
+
+    def test_unchanged_detail_skips_queries_and_rendering(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        url = reverse('course-detail', args=[course.code])
+        first = client.get(url)
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert response.status_code == 304
+        assert len(ctx.captured_queries) == 1
+        assert not response.content
+
+    def test_detail_changes_after_review_edit(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        url = reverse('course-detail', args=[course.code])
+        first = client.get(url)
+
+        reviews[0].text_review = "Changed my mind."
+        reviews[0].save()
+
+        assert client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code == 200
+
+    def test_detail_changes_after_review_delete(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        url = reverse('course-detail', args=[course.code])
+        first = client.get(url)
+
+        reviews[0].delete()
+
+        assert client.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code == 200
+
+    def test_detail_renders_the_row_its_etag_describes(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        url = reverse('course-detail', args=[course.code])
+        first = client.get(url)
+        # Another process (an import, say) can't drop this process's cached row
+        Course.objects.filter(pk=course.pk).update(name='Renamed Elsewhere', version=F('version') + 1)
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+
+        assert response.status_code == 200
+        assert response['ETag'] != first['ETag']
+        assert response.context['course'].name == 'Renamed Elsewhere'
+
+    def test_detail_changes_after_author_rename(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        Review.objects.filter(pk=reviews[0].pk).update(is_anonymous=False)
+        url = reverse('course-detail', args=[course.code])
+        first = client.get(url)
+
+        author = reviews[0].author
+        author.username = 'renamed-author'
+        author.save()
+
+        response = client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        assert response.status_code == 200
+        assert 'renamed-author' in response.content.decode()
+
+    def test_detail_etag_is_personal(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        url = reverse('course-detail', args=[course.code])
+        anonymous = client.get(url)
+
+        client.force_login(reviews[0].author)
+        response = client.get(url, HTTP_IF_NONE_MATCH=anonymous['ETag'])
+
+        assert response.status_code == 200
+        assert response.context['user_review'] == reviews[0]
+
+    def test_review_fragments_are_conditional_per_page(self, client, course_with_two_reviews):
+        course, reviews = course_with_two_reviews
+        params = {'course_code': course.code, 'sort': '-overall_rating'}
+
+        assert self.revalidate(client, reverse('get-reviews'), params).status_code == 304
+
+        first = client.get(reverse('get-reviews'), params)
+        other_sort = client.get(reverse('get-reviews'), {**params, 'sort': 'overall_rating'},
+                                HTTP_IF_NONE_MATCH=first['ETag'])
+        assert other_sort.status_code == 200
+
+    def test_scroll_fragments_are_conditional(self, client, courses):
+        assert self.revalidate(client, reverse('get-courses'), {'sort': 'name'}).status_code == 304
+
+
+@pytest.mark.django_db
+class TestAutocomplete:
+
+    def suggest(self, client, text):
+        response = client.get(reverse('course-autocomplete'), {'search': text})
+        return [course['code'] for course in response.context['suggestions']]
+
+    def test_matches_code_and_name_word_prefixes_by_rating(self, client):
+        low = CourseFactory(code="31251", name="Data Structures")
+        high = CourseFactory(code="41040", name="Big Data Analytics")
+        CourseFactory(code="48000", name="Ethics")
+        Course.objects.filter(pk=high.pk).update(overall_rating=4.5)
+        Course.objects.filter(pk=low.pk).update(overall_rating=2.0)
+        bump_catalogue_generation()
+
+        assert self.suggest(client, "dat") == [high.code, low.code]
+        assert self.suggest(client, "312") == [low.code]
+        assert self.suggest(client, "data anal") == [high.code]
+        assert self.suggest(client, "zzz") == []
+
+    def test_index_follows_catalogue_changes(self, client):
+        assert self.suggest(client, "quant") == []
+
+        course = CourseFactory(name="Quantum Computing")
+
+        assert self.suggest(client, "quant") == [course.code]
+
+    def test_limits_suggestions(self, client):
+        CourseFactory.create_batch(12, name="Law Elective")
+
+        assert len(self.suggest(client, "law")) == AUTOCOMPLETE_LIMIT
+
+
+@pytest.mark.django_db
+class TestFacetCounts:
+
+    @pytest.fixture
+    def catalogue(self):
+        CourseFactory.create_batch(3, faculty='science', sessions=['Autumn'], has_sessions=True)
+        CourseFactory.create_batch(2, faculty='science', sessions=['Spring'], has_sessions=True)
+        CourseFactory(faculty='Law', sessions=['Autumn', 'Spring'], has_sessions=True)
+        CourseFactory(faculty='Law', sessions=[], has_sessions=False)
+
+    def counts(self, facets, name):
+        facet = next(facet for facet in facets if facet['name'] == name)
+        return {option['value']: option['count'] for option in facet['options'] if option['count']}
+
+    def test_home_page_shows_counts(self, client, catalogue):
+        response = client.get(reverse('course-list'))
+        facets = response.context['facets']
+
+        assert self.counts(facets, 'faculty') == {'science': 5, 'Law': 2}
+        assert self.counts(facets, 'session') == {'Autumn': 4, 'Spring': 3, 'Unavailable': 1}
+        assert 'Science <span class="text-gray-500 dark:text-gray-400">(5)</span>' in response.content.decode()
+
+    def test_counts_apply_the_other_filters(self, client, catalogue):
+        response = client.get(reverse('filter_courses'), {'faculty': 'Law', 'session': 'Autumn'})
+        facets = response.context['facets']
+
+        # Faculty counts ignore the faculty selection but respect the session one, and vice versa
+        assert self.counts(facets, 'faculty') == {'science': 3, 'Law': 1}
+        assert self.counts(facets, 'session') == {'Autumn': 1, 'Spring': 1, 'Unavailable': 1}
+        assert 'hx-swap-oob="true"' in response.content.decode()
+
+    def test_one_query_per_facet_then_cached(self, catalogue, django_assert_num_queries):
+        course_filter = CourseFilter(QueryDict('session=Autumn&sort=name'), queryset=Course.objects.all())
+
+        # Each also reads the catalogue generation for its cache key
+        with django_assert_num_queries(len(CourseFilter.FACETS) + 1):
+            course_filter.facet_counts()
+        with django_assert_num_queries(1):
+            CourseFilter(QueryDict('sort=-name&session=Autumn'), queryset=Course.objects.all()).facet_counts()
+
+    def test_counts_follow_catalogue_changes(self, catalogue):
+        course_filter = CourseFilter(QueryDict(), queryset=Course.objects.all())
+        assert self.counts(course_filter.facet_counts(), 'faculty')['Law'] == 2
+
+        CourseFactory(faculty='Law')
+
+        assert self.counts(course_filter.facet_counts(), 'faculty')['Law'] == 3
+
+    def test_counts_respect_search(self, client, catalogue):
+        CourseFactory(name='Forensic Chemistry', faculty='science')
+
+        response = client.get(reverse('filter_courses'), {'search': 'forensic'})
+
+        assert self.counts(response.context['facets'], 'faculty') == {'science': 1}
+
+
+@pytest.mark.django_db
+class TestCourseListProjection:
+
+    def test_list_views_leave_large_columns_unloaded(self, client, courses):
+        for view in ('course-list', 'filter_courses', 'get-courses'):
+            page = client.get(reverse(view), {'sort': '-enjoyment'}).context['courses']
+            assert all({'description', 'page_reference'} <= course.get_deferred_fields() for course in page)
+
+    @pytest.mark.parametrize('level, sessions', [('UG', ['Autumn']), ('PG', [])])
+    def test_card_template_only_uses_projected_fields(self, level, sessions, django_assert_num_queries):
+        CourseFactory.create_batch(3, level=level, sessions=sessions, has_sessions=bool(sessions))
+        page = KeysetPaginator(Course.objects.for_list(), 2).page()
+
+        # Touching a deferred field would load it with an extra query per card
+        with django_assert_num_queries(0):
+            render_to_string('a_reviews/course_list.html', {'courses': page})
@@ -18,6 +18,7 @@ urlpatterns = [
     path('', course_list, name='course-list'),
     path('courses/filter/', filter_courses, name='filter_courses'),  
     path('get-courses/', get_courses, name='get-courses'),
+    path('courses/autocomplete/', autocomplete_courses, name='course-autocomplete'),
     
     # Read - Reviews
     path('courses/<str:code>/', course_details, name="course-detail"), 
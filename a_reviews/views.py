@@ -1,26 +1,54 @@
-from django.http import HttpResponse
+import hashlib
+
+from django.contrib import messages
+from django.core.cache import cache
+from django.http import HttpResponse, QueryDict
 from django.shortcuts import get_object_or_404, redirect, render
-from django.views.decorators.http import require_http_methods
+from django.views.decorators.http import condition, require_http_methods
 from a_reviews.filters import CourseFilter, ReviewFilter
 from a_reviews.forms import ReviewForm
 from a_reviews.models import Course, Review
+from a_reviews.caching import (
+    COURSE_CACHE_TIMEOUT, RESULT_CACHE_ROWS, RESULT_CACHE_TIMEOUT, canonical_params, catalogue_generation,
+    course_code_key, course_key, result_cache_key,
+)
+from a_reviews.pagination import CachedKeysetPaginator, KeysetPaginator
+from a_reviews.search import autocomplete
 from django.contrib.auth.decorators import login_required
-from django.db.models import Q
-from django.core.paginator import Paginator
+from django.db.models import Max, Q
 from django.conf import settings
-from django.db.models import Case, When, IntegerField
 
 
 
 # Create your views here.
 
+def get_course_or_404(code, version=None):
+    """
+    Course (with its rating histogram) for a code, read through the cache.
+    Course saves, rating changes and imports drop the cached row; the short timeout
+    covers anything else that writes to the table. Pass the course's current
+    ``version`` when it is known, a cached row of another version is refetched.
+    """
+    pk = cache.get(course_code_key(code))
+    course = cache.get(course_key(pk)) if pk is not None else None
+    # A code can move to another course, so the cached row must still carry it. Writes from
+    # other processes can't drop this process's cached row, but they do bump the version.
+    if course is None or course.code != code or (version is not None and course.version != version):
+        course = get_object_or_404(Course.objects.select_related('histogram'), code=code)
+        cache.set_many({
+            course_code_key(code): course.pk,
+            course_key(course.pk): course,
+        }, COURSE_CACHE_TIMEOUT)
+    return course
+
+
 # CUD Views for Reviews 
 
 # Create 
 @login_required
 @require_http_methods(["POST"])
 def htmx_create_review(request, code):
-    course = get_object_or_404(Course, code=code)
+    course = get_course_or_404(code)
     
     form = ReviewForm(request.POST)
     
@@ -30,8 +58,9 @@ def htmx_create_review(request, code):
         review.author = request.user
         review.save()
         
-        # Update course ratings after new review
-        course.update_ratings()
+        # Saving the review already applied its ratings to the course row and histogram, just reload them.
+        # refresh_from_db() would keep the cached histogram, so fetch the course afresh.
+        course = Course.objects.select_related('histogram').get(pk=course.pk)
         
         # Prepare context for both the new review AND the updated header
         user_review = review  # User now has a review
@@ -154,79 +183,118 @@ def htmx_update_review(request, review_id):
 # Read - Course Views 
 
 # view that returns initial course list 
+# Conditional GET validators: unchanged pages and fragments come back as a 304 without
+# running the feed queries or rendering templates
+
+def make_etag(request, *parts):
+    """
+    ETag for a response built from ``parts``, personalised to the viewer.
+    None (no conditional handling) while flash messages are waiting to be shown.
+    """
+    if len(messages.get_messages(request)):
+        return None
+    viewer = request.user.pk if request.user.is_authenticated else 'anonymous'
+    return hashlib.md5(repr((request.get_full_path(), viewer, *parts)).encode()).hexdigest()
+
+
+def course_list_etag(request, *args, **kwargs):
+    # Every course and review write bumps the catalogue generation
+    return make_etag(request, catalogue_generation())
+
+
+def course_validators(request, code):
+    """(version, updated_at, latest review change) for a course, looked up once per request"""
+    if not hasattr(request, '_course_validators'):
+        request._course_validators = Course.objects.filter(code=code).annotate(
+            reviews_updated=Max('review__updated_at')
+        ).values_list('version', 'updated_at', 'reviews_updated').first()
+    return request._course_validators
+
+
+def course_version(request, code):
+    """The course's version as the ETag saw it, so the page is rendered from the same row"""
+    validators = course_validators(request, code)
+    return validators[0] if validators else None
+
+
+def course_code_from_request(request, code=None):
+    return code or request.GET.get('course_code')
+
+
+def course_etag(request, code=None):
+    # Review edits and author renames show up in reviews_updated, review creates and deletes bump
+    # the course version.
+    # Viewer is part of the ETag, which also covers the user_review button state.
+    validators = course_validators(request, course_code_from_request(request, code))
+    return validators and make_etag(request, *validators)
+
+
+def course_last_modified(request, code=None):
+    validators = course_validators(request, course_code_from_request(request, code))
+    if not validators:
+        return None
+    version, updated_at, reviews_updated = validators
+    return max(updated_at, reviews_updated or updated_at)
+
+
+def paginate_courses(params, cursor=None):
+    """
+    Filter courses by the given query params and return (filter, page).
+    Filter and sort combinations are served from a cached result list. The unfiltered
+    feed is read straight off the rank_score index, and free text searches are too
+    varied to be worth caching, so both go to the database.
+    """
+    course_filter = CourseFilter(params, queryset=Course.objects.for_list())
+    if not canonical_params(params) or params.get('search', '').strip():
+        paginator = KeysetPaginator(course_filter.qs, settings.PAGE_SIZE)
+    else:
+        paginator = CachedKeysetPaginator(
+            course_filter.qs, settings.PAGE_SIZE,
+            cache_key=result_cache_key('course-results', params),
+            timeout=RESULT_CACHE_TIMEOUT, max_rows=RESULT_CACHE_ROWS,
+        )
+    return course_filter, paginator.page(cursor)
+
+
+@condition(etag_func=course_list_etag)
 def course_list(request):
-    courses = Course.objects.order_by(
-        Case(
-            When(level='UG', then=1),
-            When(level='PG', then=2),
-            output_field=IntegerField(),
-        ),
-        '-has_sessions', 
-        '-overall_rating', 
-        '-review_count'
-    )
-    paginator = Paginator(courses, settings.PAGE_SIZE)
-    course_page = paginator.page(1)
-    return render(request, 'a_reviews/home.html', {'courses': course_page})
+    # Default Meta.ordering (rank_score) is served straight from its index
+    course_filter, course_page = paginate_courses(QueryDict())
+    return render(request, 'a_reviews/home.html', {
+        'courses': course_page,
+        'facets': course_filter.facet_counts(),
+    })
 
 # view that returns a filtered list of courses 
 def filter_courses(request):
     """
     Handle course filtering, searching, and sorting using django-filters
     """
-    # Create the filter instance
-    course_filter = CourseFilter(request.GET, queryset=Course.objects.all())
-    
-    # Get the filtered and sorted queryset
-    filtered_courses = course_filter.qs
-    
-    # Handle pagination
-    page_list = request.GET.getlist('page')
-    if page_list:
-        try:
-            page_number = max(int(p) for p in page_list if p.isdigit())
-        except:
-            page_number = 1
-    else:
-        page_number = 1
-    
-    # Apply pagination
-    paginator = Paginator(filtered_courses, settings.PAGE_SIZE)
-    try:
-        course_page = paginator.page(page_number)
-    except:
-        course_page = paginator.page(1)
+    # A new filter state always starts from the first page
+    course_filter, course_page = paginate_courses(request.GET)
     
     # Debug logging (optional)
     print(f"Applied filters: {dict(request.GET)}")
-    print(f"Filtered course count: {filtered_courses.count()}")
-    print(f"Showing page {page_number} of {paginator.num_pages}")
     
-    return render(request, 'a_reviews/course_list.html', {
+    # Course cards plus an out of band refresh of the filter modal's counts
+    return render(request, 'a_reviews/partials/filtered-courses.html', {
         'courses': course_page,
-        'filter': course_filter
+        'filter': course_filter,
+        'facets': course_filter.facet_counts(),
     })
 
 
 
 # view for infinite scroll with persistent filtering of new items
+@condition(etag_func=course_list_etag)
 def get_courses(request):
     """
     Handle infinite scroll pagination with filtering
     """
-    page = request.GET.get('page', 1)
-    
-    # Use the same filtering logic as filter_courses
-    course_filter = CourseFilter(request.GET, queryset=Course.objects.all())
-    filtered_courses = course_filter.qs
+    cursor = request.GET.get('cursor')
     
-    # Apply pagination
-    paginator = Paginator(filtered_courses, settings.PAGE_SIZE)
-    
-    try:
-        course_page = paginator.page(page)
-    except:
-        course_page = paginator.page(1)
+    # Same filtering as filter_courses, continuing after the last course of the previous page
+    course_filter, course_page = paginate_courses(request.GET, cursor)
     
     context = {
         'courses': course_page
@@ -235,17 +303,23 @@ def get_courses(request):
     return render(request, 'a_reviews/course_list.html', context)
 
 
+# typeahead suggestions for the search box, served from the in-process prefix index
+def autocomplete_courses(request):
+    suggestions = autocomplete(Course.objects.all(), request.GET.get('search', ''))
+    return render(request, 'a_reviews/partials/autocomplete-results.html', {'suggestions': suggestions})
+
+
 # Read - Review 
 
 # views that returns initial course reviews page 
+@condition(etag_func=course_etag, last_modified_func=course_last_modified)
 def course_details(request, code):
-    course = get_object_or_404(Course, code=code)
-    reviews = course.review_set.all().order_by('-review_date')
+    course = get_course_or_404(code, course_version(request, code))
+    reviews = Review.objects.feed().filter(course=course).order_by('-review_date')
     form = ReviewForm()
 
 
-    paginator = Paginator(reviews, settings.PAGE_SIZE)
-    reviews = paginator.page(1)
+    reviews = KeysetPaginator(reviews, settings.PAGE_SIZE).page()
 
     # Check if the current user has already reviewed this course
     user_review = None
@@ -268,8 +342,8 @@ def course_details(request, code):
 
 # View that returns a filtered list of reviews
 def filter_reviews(request, code):
-    course = get_object_or_404(Course, code=code)
-    reviews_queryset = course.review_set.all()
+    course = get_course_or_404(code)
+    reviews_queryset = Review.objects.feed().filter(course=course)
     
     review_filter = ReviewFilter(request.GET, queryset=reviews_queryset)
     filtered_reviews = review_filter.qs
@@ -277,8 +351,7 @@ def filter_reviews(request, code):
     if not request.GET.get('sort'):
         filtered_reviews = filtered_reviews.order_by('-review_date')
     
-    paginator = Paginator(filtered_reviews, settings.PAGE_SIZE)
-    review_page = paginator.page(1)
+    review_page = KeysetPaginator(filtered_reviews, settings.PAGE_SIZE).page()
     
     context = {
         'reviews': review_page,
@@ -290,15 +363,16 @@ def filter_reviews(request, code):
 
 
 # view for infinite scroll with persistent filtering of new items
+@condition(etag_func=course_etag, last_modified_func=course_last_modified)
 def get_reviews(request):
     """
     Handle infinite scroll pagination for reviews with filtering
     """
-    page = request.GET.get('page', 1)
+    cursor = request.GET.get('cursor')
     course_code = request.GET.get('course_code')
     
-    course = get_object_or_404(Course, code=course_code)
-    reviews_queryset = course.review_set.all()
+    course = get_course_or_404(course_code, course_version(request, course_code))
+    reviews_queryset = Review.objects.feed().filter(course=course)
     
     # Apply the same filtering logic as filter_reviews
     review_filter = ReviewFilter(request.GET, queryset=reviews_queryset)
@@ -308,12 +382,8 @@ def get_reviews(request):
     if not request.GET.get('sort'):
         filtered_reviews = filtered_reviews.order_by('-review_date')
     
-    paginator = Paginator(filtered_reviews, settings.PAGE_SIZE)
-    
-    try:
-        review_page = paginator.page(page)
-    except:
-        review_page = paginator.page(1)
+    # Continue after the last review of the previous page, no COUNT or OFFSET
+    review_page = KeysetPaginator(filtered_reviews, settings.PAGE_SIZE).page(cursor)
     
     context = {
         'reviews': review_page,
@@ -327,7 +397,7 @@ def get_reviews(request):
 # as soon as review is submitted from modal (uses htmx to avoid page reload of that state)
 
 def refresh_course_header(request, course_code):
-    course = get_object_or_404(Course, code=course_code)
+    course = get_course_or_404(course_code)
     user_review = None
     if request.user.is_authenticated:
         try:
@@ -3,16 +3,27 @@ from allauth.account.signals import user_signed_up, user_logged_in
 from django.dispatch import receiver
 from django.contrib import messages
 
-from a_reviews.models import Review
+from a_reviews.models import Review, rating_changes, record_rating_delta
 
 
 @receiver(user_logged_in)
 def custom_login_message(request, user, **kwargs):
     messages.success(request, f"Signed in as: {user.username}!")
 
-from django.db.models.signals import post_delete
+from django.contrib.auth import get_user_model
+from django.db.models.functions import Now
+from django.db.models.signals import post_delete, pre_save
 from django.dispatch import receiver
 
 @receiver(post_delete, sender=Review)
 def update_course_ratings_on_review_delete(sender, instance, **kwargs):
-    instance.course.update_ratings()
\ No newline at end of file
+    record_rating_delta(instance.course_id, -1, **rating_changes(instance.rating_scores(), sign=-1))
+
+
+@receiver(pre_save, sender=get_user_model())
+def touch_reviews_on_username_change(sender, instance, update_fields=None, **kwargs):
+    # Reviews render their author's name, touching them changes the review feeds' ETags
+    if instance.pk is None or (update_fields is not None and 'username' not in update_fields):
+        return
+    if sender.objects.filter(pk=instance.pk).exclude(username=instance.username).exists():
+        Review.objects.filter(author_id=instance.pk).update(updated_at=Now())
@@ -1,7 +1,7 @@
 from django.shortcuts import redirect, render
 from django.http import HttpResponse
 from django.urls import reverse
-from a_reviews.models import Review
+from a_reviews.models import Review, deferred_rating_updates
 from django.contrib import messages
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
@@ -25,7 +25,7 @@ def user_page(request):
         return redirect('user-page')  # Replace with your actual URL name
     
     # GET request (normal page load)
-    user_reviews = Review.objects.filter(author=request.user).select_related('course').order_by('-review_date')
+    user_reviews = Review.objects.feed().filter(author=request.user).order_by('-review_date')
     
     context = {
         'reviews': user_reviews,
@@ -161,8 +161,9 @@ def delete_account(request):
         # Log the user out first
         logout(request)
         
-        # Delete the user account
-        user.delete()
+        # Delete the user account, cascading reviews update each course once
+        with deferred_rating_updates():
+            user.delete()
         
         # Add a message (will be shown on redirect page)
         messages.success(request, 'Your account has been successfully deleted.')